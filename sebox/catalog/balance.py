@@ -0,0 +1,111 @@
+import typing as tp
+from heapq import heapify, heappush, heappop
+
+import numpy as np
+
+
+# relative cost of a station without bands to select
+_base = 0.05
+
+
+def lpt(costs: np.ndarray, nprocs: int) -> tp.List[tp.List[int]]:
+    """Assign items to processes longest processing time first, each item goes to the least loaded process."""
+    groups = [[] for _ in range(nprocs)]
+    loads = [(0.0, i) for i in range(nprocs)]
+    heapify(loads)
+
+    for i in np.argsort(-np.asarray(costs), kind='stable'):
+        load, p = heappop(loads)
+        groups[p].append(int(i))
+        heappush(loads, (load + costs[i], p))
+
+    return groups
+
+
+def features(stations: tp.List[str], evt: tp.Any) -> tp.Tuple[np.ndarray, np.ndarray]:
+    """Number of bands to select (from traces.pickle) and epicentral distance in degrees of each station."""
+    from obspy.geodetics import locations2degrees
+    from nnodes import root
+    from sebox.catalog import catalog
+
+    nbands = np.full(len(stations), 3 * catalog.process['nbands'])
+    dist = np.full(len(stations), 90.0)
+
+    # same band selection as _blend
+    traces = root.load('traces.pickle') if root.has('traces.pickle') else None
+
+    try:
+        names = {sta: i for i, sta in enumerate(catalog.stations)}
+        coords = catalog.station_data
+
+    except AttributeError:
+        names = {}
+        coords = None
+
+    origin = evt.preferred_origin() or evt.origins[0]
+
+    for i, sta in enumerate(stations):
+        if traces is not None:
+            nbands[i] = sum(np.count_nonzero(b) for b in traces.get(sta, {}).values())
+
+        if sta in names:
+            lat, lon = coords[names[sta], :2]
+            dist[i] = locations2degrees(lat, lon, origin.latitude, origin.longitude)
+
+    return nbands, dist
+
+
+def estimate(nbands: np.ndarray, dist: np.ndarray, timings: tp.Dict[str, float], stations: tp.List[str]) -> np.ndarray:
+    """Cost of each station from a previous run if available, otherwise from its bands and distance.
+
+    Each band costs more at larger distance (longer range of candidate windows), the model is scaled to
+    seconds by stations with known timings."""
+    model = _base + nbands * (1 + dist / 90)
+    known = np.array([sta in timings for sta in stations], dtype=bool)
+
+    if not np.any(known):
+        return model
+
+    seconds = np.array([timings[sta] for sta in np.array(stations)[known]])
+    scale = np.median(seconds / model[known])
+    cost = model * scale
+    cost[known] = seconds
+
+    return cost
+
+
+def schedule(stations: tp.List[str], evt: tp.Any, timings: tp.Dict[str, float], nprocs: int) -> tp.List[tp.List[str]]:
+    """Stations of each process balanced by estimated cost (empty groups are removed)."""
+    nbands, dist = features(stations, evt)
+    cost = estimate(nbands, dist, timings, stations)
+    groups = lpt(cost, min(nprocs, len(stations)))
+
+    return [[stations[i] for i in g] for g in groups if len(g)]
+
+
+def write(dst: str, rank: int, station: str, seconds: float):
+    """Append time of window selection of a station to the log of a rank."""
+    from nnodes import root
+
+    root.mkdir(dst)
+
+    with open(root.path(f'{dst}/{rank:04d}.txt'), 'a') as f:
+        f.write(f'{station} {seconds:.3f}\n')
+
+
+def collect(src: str, timings: tp.Optional[tp.Dict[str, float]] = None) -> tp.Dict[str, float]:
+    """Timings logged by all ranks in directory src, added to timings of previous runs."""
+    from nnodes import root
+
+    timings = dict(timings or {})
+
+    if root.has(src):
+        for f in root.ls(src):
+            if f.endswith('.txt'):
+                with open(root.path(f'{src}/{f}'), 'r') as fp:
+                    for line in fp.readlines():
+                        # skip incomplete last line
+                        if line.endswith('\n') and len(ll := line.split()) == 2:
+                            timings[ll[0]] = float(ll[1])
+
+    return timings
@@ -0,0 +1,83 @@
+import typing as tp
+from functools import lru_cache
+
+import numpy as np
+
+if tp.TYPE_CHECKING:
+    from obspy import Trace
+
+
+# corner frequencies of the band filters (same as pre_filt of sac_filter_trace)
+Plan = tp.Tuple[tp.Tuple[float, float, float, float], ...]
+
+def band_plan() -> Plan:
+    """Corner frequencies of each band in catalog.toml."""
+    from sebox.catalog import catalog
+
+    nbands = catalog.process['nbands']
+
+    df = 1 / catalog.process['duration_encoding'] / 60
+    imin = int(np.ceil(1 / catalog.process['period_max'] / df))
+    imax = int(np.floor(1 / catalog.process['period_min'] / df)) + 1
+    fincr = (imax - imin) // nbands
+
+    cl = catalog.process['corner_left']
+    cr = catalog.process['corner_right']
+
+    plan = []
+
+    for iband in range(nbands):
+        i1 = imin + iband * fincr
+        i2 = i1 + fincr
+
+        fmin = i1 * df
+        fmax = (i2 - 1) * df
+        plan.append((fmin * cr, fmin, fmax, fmax / cl))
+
+    return tuple(plan)
+
+
+@lru_cache(maxsize=16)
+def _tapers(npts: int, delta: float, plan: Plan) -> np.ndarray:
+    """Cosine tapers of all bands in frequency domain."""
+    from obspy.signal.invsim import cosine_sac_taper
+    from obspy.signal.util import _npts2nfft
+
+    nfft = _npts2nfft(npts)
+    freqs = np.linspace(0, 1 / (delta * 2), nfft // 2 + 1)
+
+    return np.stack([cosine_sac_taper(freqs, flimit=pre_filt) for pre_filt in plan])
+
+
+def filter_bands(data: np.ndarray, delta: float, plan: Plan) -> np.ndarray:
+    """Filter data with all bands (equivalent to calling sac_filter_trace for each band), shape [nbands, npts].
+
+    Bands have the floating point type of data (transforms run in double precision)."""
+    from scipy.fft import rfft, irfft
+    from obspy.signal.util import _npts2nfft
+
+    npts = len(data)
+    nfft = _npts2nfft(npts)
+    dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+
+    # one forward transform and one batched inverse transform
+    spec = rfft(np.asarray(data, dtype=float), n=nfft)
+    specs = spec[np.newaxis, :] * _tapers(npts, delta, plan)
+    specs[:, -1] = np.abs(specs[:, -1])
+
+    return irfft(specs, n=nfft, axis=-1)[:, :npts].astype(dtype, copy=False)
+
+
+def bands(tr: 'Trace', plan: tp.Optional[Plan] = None) -> np.ndarray:
+    """Filtered bands of a trace, shape [nbands, npts] (callers filter a trace once and index the bands they need)."""
+    if plan is None:
+        plan = band_plan()
+
+    return filter_bands(tr.data, tr.stats.delta, plan)
+
+
+def band_trace(tr: 'Trace', data: np.ndarray) -> 'Trace':
+    """Trace with the same stats as tr and data of a filtered band."""
+    from obspy import Trace
+
+    return Trace(np.array(data), tr.stats.copy())
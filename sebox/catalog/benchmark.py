@@ -0,0 +1,316 @@
+import typing as tp
+from time import perf_counter
+import tracemalloc
+
+import numpy as np
+
+if tp.TYPE_CHECKING:
+    from nnodes import Node
+
+
+# stages that are timed, in order of execution
+stages = ('index', 'process', 'window', 'ft')
+
+# components of generated observed data
+_components = (('Z', 'N', 'E'), ('Z', '1', '2'))
+
+# poles, zeros and gain of generated instrument responses
+_responses = {
+    'sts2': ([0j, 0j], [-0.037 + 0.037j, -0.037 - 0.037j, -251.3 + 0j, -131.0 + 467.3j, -131.0 - 467.3j], 1500.0, 'M/S'),
+    'acc': ([], [-981.0 + 1009.0j, -981.0 - 1009.0j], 1.0, 'M/S**2')
+}
+
+
+def benchmark(node: 'Node'):
+    """Benchmark catalog stages with a synthetic catalog."""
+    from json import dumps, loads
+
+    rates = node.rates or (20.0, 40.0, 100.0)
+    responses = node.responses or tuple(_responses)
+
+    generate(node.path('bench'), node.nevents or 2, node.nstations or 20, rates, responses, node.seed or 0)
+    result = run(node.path('bench'))
+    node.write(dumps(result, indent=2), 'bench.json')
+
+    if node.reference:
+        print(compare(loads(node.read(node.reference)), result))
+
+
+def generate(dst: str, nevents: int, nstations: int, rates: tp.Sequence[float],
+    responses: tp.Sequence[str], seed: int = 0):
+    """Write a synthetic catalog with events, stations, mseed and StationXML files."""
+    from os import makedirs
+    from obspy import UTCDateTime, Stream, Trace
+    from obspy.core.inventory import Inventory, Network, Station, Channel, Response
+    from obspy.geodetics import locations2degrees
+    from sebox.catalog import catalog
+    from .index import format_station
+
+    rng = np.random.default_rng(seed)
+    proc = catalog.process
+    gap = catalog.download['gap'] * 60
+    duration = proc['duration'] * 60 + 2 * gap
+    makedirs(f'{dst}/events', exist_ok=True)
+    makedirs(f'{dst}/stations', exist_ok=True)
+
+    for i in range(nevents):
+        event = f'C{i:08d}A'
+        time = UTCDateTime(2020, 1, 1) + 86400 * i
+        elat = rng.uniform(-60, 60)
+        elon = rng.uniform(-180, 180)
+        depth = rng.uniform(10, 600)
+        mt = rng.normal(size=6) * 1e25
+
+        lines = [f' PDE {time.year} {time.month} {time.day} {time.hour} {time.minute} {time.second:.2f} '
+            f'{elat:.4f} {elon:.4f} {depth:.1f} 6.0 6.0 SYNTHETIC',
+            f'event name:     {event}', 'time shift:       0.0000', 'half duration:    5.0000',
+            f'latitude:       {elat:.4f}', f'longitude:      {elon:.4f}', f'depth:          {depth:.4f}']
+        lines += [f'{m}:       {v:.6e}' for m, v in zip(('Mrr', 'Mtt', 'Mpp', 'Mrt', 'Mrp', 'Mtp'), mt)]
+
+        with open(f'{dst}/events/{event}', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        makedirs(f'{dst}/downloads/{event}/mseed', exist_ok=True)
+        makedirs(f'{dst}/downloads/{event}/xml', exist_ok=True)
+        makedirs(f'{dst}/raw_syn/{event}', exist_ok=True)
+        station_lines = ''
+
+        for j in range(nstations):
+            net = 'XX'
+            sta = f'S{j:04d}'
+            slat = rng.uniform(-80, 80)
+            slon = rng.uniform(-180, 180)
+            rate = rates[j % len(rates)]
+            cmps = _components[j % 2]
+            rtype = responses[j % len(responses)]
+            zeros, poles, gain, unit = _responses[rtype]
+
+            # arrival of a surface wave packet
+            dist = locations2degrees(elat, elon, slat, slon) * 111.19
+            t0 = gap + dist / 3.8 - rng.uniform(0, 60)
+            npts = int(duration * rate)
+            t = np.arange(npts) / rate
+            starttime = time - gap + rng.uniform(0, 1 / rate)
+
+            a1 = rng.uniform(0, 360)
+            orientations = {'Z': (0.0, -90.0), 'N': (0.0, 0.0), 'E': (90.0, 0.0), '1': (a1, 0.0), '2': ((a1 + 90) % 360, 0.0)}
+            channels = []
+            obs = Stream()
+            syn = Stream()
+
+            for cmp, scmp in zip(cmps, ('Z', 'N', 'E')):
+                azimuth, dip = orientations[cmp]
+                cha = f'BH{cmp}'
+
+                resp = Response.from_paz(zeros, poles, gain, input_units=unit, output_units='COUNTS')
+                channels.append(Channel(cha, '', slat, slon, 0.0, 0.0, azimuth=azimuth, dip=dip,
+                    sample_rate=rate, response=resp, start_date=time - 86400 * 365))
+
+                packet = np.exp(-((t - t0) / 300) ** 2) * np.sin(2 * np.pi * t / rng.uniform(20, 100))
+                noise = rng.normal(scale=rng.uniform(0.01, 2.0), size=npts)
+                stats = {'network': net, 'station': sta, 'location': '', 'channel': cha,
+                    'sampling_rate': rate, 'starttime': starttime}
+                obs.append(Trace(((packet + noise) * 1e6).astype(np.int32), stats))
+
+                syn_stats = {**stats, 'channel': f'MX{scmp}', 'sampling_rate': 1 / proc['dt'], 'starttime': time - gap}
+                ts = np.arange(int(duration / proc['dt'])) * proc['dt']
+                syn.append(Trace(np.exp(-((ts - t0 - rng.normal(scale=5)) / 300) ** 2) * 1e-6, syn_stats))
+
+            inv = Inventory([Network(net, [Station(sta, slat, slon, 0.0, channels=channels)])], source='sebox')
+            inv.write(f'{dst}/downloads/{event}/xml/{net}.{sta}.xml', format='STATIONXML')
+            obs.write(f'{dst}/downloads/{event}/mseed/{net}.{sta}.mseed', format='MSEED')
+            syn.write(f'{dst}/raw_syn/{event}/{net}.{sta}.mseed', format='MSEED')
+            station_lines += format_station([sta, net, f'{slat:.4f}', f'{slon:.4f}', '0.0', '0.0'])
+
+        with open(f'{dst}/stations/STATIONS.{event}', 'w') as f:
+            f.write(station_lines)
+
+
+def _load(dst: str):
+    """Read events, streams and inventories of a synthetic catalog."""
+    from os import listdir
+    from obspy import read, read_events, read_inventory
+
+    catalog = {}
+
+    for event in sorted(listdir(f'{dst}/events')):
+        evt = read_events(f'{dst}/events/{event}')[0]
+        stations = []
+
+        for src in sorted(listdir(f'{dst}/downloads/{event}/mseed')):
+            sta = src[:-len('.mseed')]
+            stations.append((sta, read(f'{dst}/downloads/{event}/mseed/{src}'),
+                read(f'{dst}/raw_syn/{event}/{src}'), read_inventory(f'{dst}/downloads/{event}/xml/{sta}.xml')))
+
+        catalog[event] = evt, stations
+
+    return catalog
+
+
+def _measure(result: dict, stage: str, func: tp.Callable[[], int]):
+    """Time a stage and record its throughput, then run it again to record its peak memory."""
+    start = perf_counter()
+    ntraces = func()
+    elapsed = perf_counter() - start
+
+    if ntraces == 0:
+        raise RuntimeError(f'{stage}: no traces processed')
+
+    # tracing allocations slows down the stage, so memory is measured in a separate pass
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result[stage] = {
+        'traces': ntraces,
+        'seconds': elapsed,
+        'traces_per_second': ntraces / elapsed if elapsed > 0 else float('inf'),
+        'peak_memory_mb': peak / 1024 ** 2
+    }
+
+
+def run(dst: str) -> dict:
+    """Run and time all stages on a synthetic catalog."""
+    from os import chdir, getcwd, listdir
+    from sebox.catalog import catalog
+    from .index import parse_event, parse_stations, format_station
+    from .process import _select, process_streams
+    from .window import _window, _ft_trace
+
+    data = _load(dst)
+    nbands = catalog.process['nbands']
+    result: tp.Dict[str, tp.Any] = {
+        'events': len(data),
+        'stations': sum(len(stas) for _, stas in data.values()),
+        'config': {
+            'process': dict(catalog.process),
+            'window': {k: v for k, v in catalog.window.items() if k != 'flexwin'}
+        }
+    }
+    processed = {}
+    windows = {}
+
+    def index():
+        n = 0
+
+        for event in listdir(f'{dst}/events'):
+            with open(f'{dst}/events/{event}') as f:
+                parse_event(f.readlines())
+
+            with open(f'{dst}/stations/STATIONS.{event}') as f:
+                for _, ll in parse_stations(f.readlines()):
+                    format_station(ll)
+                    n += 1
+
+        return n
+
+    def process():
+        n = 0
+
+        for event, (evt, stas) in data.items():
+            origin = evt.preferred_origin()
+            invs = [inv for _, _, _, inv in stas]
+            obs = [_select(st.copy()) for _, st, _, _ in stas]
+            syn = [_select(st.copy()) for _, _, st, _ in stas]
+            obs_proc = process_streams(obs, origin, invs, 'obs')
+            syn_proc = process_streams(syn, origin, invs, 'syn')
+
+            # synthetics (MX? channels) are processed with the inventory of observed data (BH? channels)
+            if any(o is not None and s is None for o, s in zip(obs_proc, syn_proc)):
+                raise RuntimeError(f'{event}: synthetic streams not processed with inventory of observed data')
+
+            processed[event] = list(zip([sta for sta, _, _, _ in stas], invs, obs_proc, syn_proc))
+            n += 3 * (len(obs) + len(syn))
+
+        return n
+
+    def window():
+        n = 0
+
+        for event, stas in processed.items():
+            evt = data[event][0]
+
+            for sta, inv, obs, syn in stas:
+                if obs is None or syn is None:
+                    continue
+
+                for cmp in ('R', 'T', 'Z'):
+                    obs_tr = obs.select(component=cmp)[0]
+                    syn_tr = syn.select(component=cmp)[0]
+                    windows[event, sta, cmp] = _window(obs_tr, syn_tr, evt, inv, cmp)
+                    n += nbands
+
+        return n
+
+    def ft():
+        n = 0
+
+        for event, stas in processed.items():
+            for sta, _, obs, syn in stas:
+                for cmp in ('R', 'T', 'Z'):
+                    if (event, sta, cmp) in windows:
+                        _ft_trace(obs.select(component=cmp)[0], syn.select(component=cmp)[0], windows[event, sta, cmp], sta, cmp)
+                        n += 1
+
+        return n
+
+    cwd = getcwd()
+
+    try:
+        # stages write output relative to the working directory
+        chdir(dst)
+
+        for stage, func in zip(stages, (index, process, window, ft)):
+            _measure(result, stage, func)
+
+    finally:
+        chdir(cwd)
+
+    return result
+
+
+def compare(ref: dict, result: dict) -> str:
+    """Compare throughput and peak memory of two benchmark results."""
+    lines = [f'{"stage":<10}{"traces/s":>14}{"ref":>14}{"speedup":>10}{"memory":>10}{"ref":>10}']
+
+    for stage in stages:
+        if stage in ref and stage in result:
+            a = ref[stage]
+            b = result[stage]
+            speedup = b['traces_per_second'] / a['traces_per_second'] if a['traces_per_second'] else float('nan')
+            lines.append(f'{stage:<10}{b["traces_per_second"]:>14.1f}{a["traces_per_second"]:>14.1f}{speedup:>10.2f}'
+                f'{b["peak_memory_mb"]:>10.1f}{a["peak_memory_mb"]:>10.1f}')
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from json import dump, load
+    from tempfile import mkdtemp
+
+    parser = ArgumentParser(description='Benchmark catalog stages with a synthetic catalog.')
+    parser.add_argument('--events', type=int, default=2, help='number of events')
+    parser.add_argument('--stations', type=int, default=20, help='number of stations per event')
+    parser.add_argument('--rates', type=float, nargs='+', default=[20.0, 40.0, 100.0], help='sampling rates of observed data')
+    parser.add_argument('--responses', nargs='+', default=list(_responses), choices=list(_responses), help='instrument response types')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--dir', default=None, help='directory of the synthetic catalog (default: temporary directory)')
+    parser.add_argument('--output', default='bench.json', help='file to save results')
+    parser.add_argument('--reference', default=None, help='previous results to compare with')
+    args = parser.parse_args()
+
+    dst = args.dir or mkdtemp(prefix='sebox_bench_')
+    generate(dst, args.events, args.stations, args.rates, args.responses, args.seed)
+    result = run(dst)
+
+    with open(args.output, 'w') as f:
+        dump(result, f, indent=2)
+
+    if args.reference:
+        with open(args.reference) as f:
+            print(compare(load(f), result))
+
+    else:
+        print(compare(result, result))
@@ -0,0 +1,81 @@
+import typing as tp
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=8)
+def taper(nt: int) -> np.ndarray:
+    """Hanning taper of length 2 * nt (read-only)."""
+    t = np.hanning(nt * 2)
+    t.setflags(write=False)
+
+    return t
+
+
+def gaps(left: np.ndarray, right: np.ndarray, npts: int, nt: int) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Ranges [start, end) between windows where synthetic data is blended in and whether a range is right of a window.
+
+    A gap is blended if it is at least nt samples long, the taper occupies nt samples next to the window."""
+    left = np.asarray(left, dtype=int)
+    right = np.asarray(right, dtype=int)
+    order = np.argsort(left)
+    left = left[order]
+    right = right[order]
+
+    # blending range left and right of each window
+    fl = np.concatenate([[0], right[:-1] + nt + 1])
+    fr = np.concatenate([left[1:] - nt - 1, [npts - 1]])
+
+    lg = left - fl >= nt
+    rg = fr - right >= nt
+
+    start = np.concatenate([fl[lg], right[rg] + 1])
+    end = np.concatenate([left[lg], fr[rg] + 1])
+    rising = np.concatenate([np.zeros(np.count_nonzero(lg), dtype=bool), np.ones(np.count_nonzero(rg), dtype=bool)])
+
+    return start, end, rising
+
+
+def blend_masks(start: np.ndarray, end: np.ndarray, rising: np.ndarray, trace: np.ndarray,
+    ntraces: int, npts: int, nt: int) -> np.ndarray:
+    """Weight of synthetic data [ntraces, npts] given gaps of all traces (trace is the trace index of each gap)."""
+    start = np.asarray(start, dtype=int)
+    end = np.asarray(end, dtype=int)
+    rising = np.asarray(rising, dtype=bool)
+    offset = np.asarray(trace, dtype=int) * npts
+
+    # part of a gap fully replaced by synthetic data
+    fs = np.where(rising, start + nt, start) + offset
+    fe = np.where(rising, end, end - nt) + offset
+
+    # mark full parts with a difference array
+    d = np.zeros(ntraces * npts + 1)
+    np.add.at(d, fs, 1)
+    np.add.at(d, fe, -1)
+    mask = (np.cumsum(d[:-1]) > 0).astype(float)
+
+    # tapered parts next to windows
+    t = taper(nt)
+    ts = np.where(rising, start, end - nt) + offset
+    idx = ts[:, np.newaxis] + np.arange(nt)
+    mask[idx[rising]] = t[:nt]
+    mask[idx[~rising]] = t[nt:]
+
+    return mask.reshape(ntraces, npts)
+
+
+def blend_mask(left: np.ndarray, right: np.ndarray, npts: int, nt: int,
+    select: tp.Optional[np.ndarray] = None) -> np.ndarray:
+    """Weight of synthetic data of a single trace with windows [left, right], optionally only for selected gaps."""
+    start, end, rising = gaps(left, right, npts, nt)
+
+    if select is not None:
+        start, end, rising = start[select], end[select], rising[select]
+
+    return blend_masks(start, end, rising, np.zeros(len(start), dtype=int), 1, npts, nt)[0]
+
+
+def blend(obs: np.ndarray, syn: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Replace observed data with synthetic data by weight (arrays of any matching shape)."""
+    return obs + (syn - obs) * mask
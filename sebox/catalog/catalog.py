@@ -52,6 +52,9 @@ def __getattr__(name):
 
             if d.has(f'{name}.npy'):
                 _cache[name] = d.load(f'{name}.npy')
+
+        if _cache[name] is not None:
+            return _cache[name]
             
     if name in _catalog:
         # items in config.toml
@@ -60,6 +63,13 @@ def __getattr__(name):
     raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 
+def get_dtype():
+    """Floating point type of processed traces."""
+    import numpy as np
+
+    return np.dtype(_catalog.get('process', {}).get('precision') or 'float64')
+
+
 # def create_catalog(node: Node):
 #     """Create a catalog database."""
 #     # create pickle file for events and event_data
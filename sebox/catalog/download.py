@@ -1,3 +1,6 @@
+from threading import Lock, local
+
+
 def download(node):
     node.add(download_events)
     node.add(download_traces)
@@ -9,59 +12,250 @@ def download_events(node):
 
 def download_traces(node):
     """Download observed data."""
+    node.mkdir('downloads')
+    node.add_mpi(request_events, 1, mpiarg=node.ls('events'), group_mpiarg=True, name='request')
+    node.add(convert_traces)
+
+
+def convert_traces(node):
+    """Convert observed data of events that are completely downloaded."""
+    node.concurrent = True
+
     for event in node.ls('events'):
-        # if not node.has(f'raw_obs/{event}.h5'):
+        if not node.has(f'downloads/{event}/{event}.h5') and _read_manifest(event)[1]:
             node.add(download_trace, event=event, name=event, cwd=f'downloads/{event}')
-            break
 
 
 def download_trace(node):
-    """Download observed data of an event."""
+    """Convert observed data of an event."""
     node.ln('../../catalog.toml')
-    arg = (node.event, f'downloads/{node.event}')
-    # node.add_mpi(request_data, arg=arg, use_multiprocessing=True)
-    # node.add_mpi(convert_h5, arg=arg, use_multiprocessing=True)
-    # node.add_mpi(convert_xml, arg=arg, use_multiprocessing=True)
+    node.add_mpi(convert_h5, 1, mpiarg=[(node.event, f'downloads/{node.event}')])
 
 
-def request_data(arg):
+def request_events(events):
+    """Download events concurrently with a global limit of simultaneous requests."""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
     from traceback import format_exc
     from nnodes import root
     from sebox.catalog import catalog
-    from obspy import read_events
-    from obspy.clients.fdsn.mass_downloader import GlobalDomain, Restrictions, MassDownloader
 
-    event = arg[0]
-    node = root.subdir(arg[1])
+    pending = {}
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=catalog.download.get('concurrency') or 8) as pool:
+        # request station lists of incomplete events
+        inv_futures = {pool.submit(_request_inventory, event): event for event in events
+            if not _read_manifest(event)[1]}
+        sta_futures = {}
+
+        for f in as_completed(inv_futures):
+            event = inv_futures[f]
+
+            try:
+                inv, t1, t2 = f.result()
+
+            except Exception:
+                root.write(format_exc(), f'downloads/{event}/error_download.log')
+                continue
+
+            if root.has(log := f'downloads/{event}/error_download.log'):
+                # error of a previous run
+                root.rm(log)
+
+            # stations of this event start downloading while other events are still listed
+            done = _read_manifest(event)[0]
+            pending[event] = 0
+            errors[event] = 0
+
+            for net in inv:
+                for sta in net:
+                    if done.get(f'{net.code}.{sta.code}') not in ('done', 'nodata', 'rejected'):
+                        sta_futures[pool.submit(_request_station, event, net.code, sta, t1, t2)] = event, f'{net.code}.{sta.code}'
+                        pending[event] += 1
+
+            if pending[event] == 0:
+                _write_manifest(event, '*', 'complete')
+
+        for f in as_completed(sta_futures):
+            event, station = sta_futures[f]
+            pending[event] -= 1
+
+            try:
+                f.result()
+
+            except Exception:
+                # event is retried in the next run
+                root.write(f'{station}\n{format_exc()}', f'downloads/{event}/error_download.log', 'a')
+                errors[event] += 1
+
+            if pending[event] == 0 and errors[event] == 0:
+                _write_manifest(event, '*', 'complete')
+
+
+# lock of manifest files shared by download threads
+_manifest_lock = Lock()
+
+# FDSN client of each download thread
+_clients = local()
+
+
+def _read_manifest(event):
+    """Status of downloaded stations of an event and whether the event is complete."""
+    from nnodes import root
+
+    stations = {}
+
+    if root.has(src := f'downloads/{event}/manifest.txt'):
+        for line in root.readlines(src):
+            if len(ll := line.split()) == 2:
+                stations[ll[0]] = ll[1]
+
+    return stations, stations.get('*') == 'complete'
+
+
+def _write_manifest(event, station, status):
+    """Record the status of a station or event in its manifest."""
+    from nnodes import root
+
+    with _manifest_lock:
+        with open(root.path(f'downloads/{event}/manifest.txt'), 'a') as f:
+            f.write(f'{station} {status}\n')
+
+
+def _client():
+    """FDSN client of the current thread."""
+    from obspy.clients.fdsn import Client
+    from sebox.catalog import catalog
+
+    if not hasattr(_clients, 'client'):
+        _clients.client = Client(catalog.download.get('provider') or 'IRIS', _discover_services=False)
+
+    return _clients.client
+
+
+def _request_inventory(event):
+    """Request or load the list of stations of an event."""
+    import re
+    from os import replace
+    from nnodes import root
+    from obspy import read_events, read_inventory
+    from sebox.catalog import catalog
+
+    evt = read_events(root.path(f'events/{event}'))[0]
+    root.mkdir(f'downloads/{event}/mseed')
+
+    gap = catalog.download['gap']
+    eventtime = evt.preferred_origin().time
+    starttime = eventtime - gap * 60
+    endtime = eventtime + (catalog.process['duration'] + gap) * 60
+
+    if root.has(dst := f'downloads/{event}/inventory.xml'):
+        return read_inventory(root.path(dst)), starttime, endtime
+
+    # FDSN wildcards of channel priorities, e.g. BH[ZNE] -> BH?
+    chas = catalog.download['restrictions'].get('channel_priorities') or ['*']
+    cha = ','.join(sorted(set(re.sub(r'\[[^\]]*\]', '?', c) for c in chas)))
+
+    # responses are requested per station only if they are not in the shared store
+    inv = _client().get_stations(starttime=starttime, endtime=endtime, channel=cha, level='channel')
+
+    # write to a temporary file so that an interrupted write is not reused
+    inv.write(root.path(dst + '.tmp'), format='STATIONXML')
+    replace(root.path(dst + '.tmp'), root.path(dst))
+
+    return inv, starttime, endtime
+
+
+def _request_station(event, net, sta, starttime, endtime):
+    """Download 3-component data of a station and record the result in the manifest."""
+    from nnodes import root
+    from obspy.clients.fdsn.header import FDSNNoDataException
+    from sebox.catalog import catalog
+    from .process import _priorities, _rank
+    from .inventory import find_station, store_station, add_reference
+
+    rst = catalog.download['restrictions']
+    priorities = _priorities()
+    station = f'{net}.{sta.code}'
+
+    # group channels by location and channel code without component
+    groups = {}
+
+    for cha in sta.channels:
+        if priorities[1] and _rank(cha.location_code, cha.code, priorities)[1] == len(priorities[1]):
+            continue
+
+        groups.setdefault((cha.location_code, cha.code[:-1]), {}).setdefault(cha.code[-1], cha)
+
+    best = None
+
+    for order, ((loc, code), cmps) in enumerate(groups.items()):
+        for h, pair in enumerate((('N', 'E'), ('1', '2'))):
+            if 'Z' in cmps and pair[0] in cmps and pair[1] in cmps:
+                rank = (*_rank(loc, code + 'Z', priorities), h, order)
+
+                if best is None or rank < best[0]:
+                    best = rank, loc, [code + c for c in ('Z', *pair)]
+
+                break
+
+    if best is None:
+        _write_manifest(event, station, 'nodata')
+        return
+
+    _, loc, chas = best
 
     try:
-        evt = read_events(f'events/{event}')[0]
-        node.mkdir('mseed')
-        node.mkdir('xml')
+        st = _client().get_waveforms_bulk([(net, sta.code, loc, cha, starttime, endtime) for cha in chas])
 
-        gap = catalog.download['gap']
-        eventtime = evt.preferred_origin().time
-        starttime = eventtime - gap * 60
-        endtime = eventtime + (catalog.duration + gap) * 60
+    except FDSNNoDataException:
+        _write_manifest(event, station, 'nodata')
+        return
 
-        rst = Restrictions(starttime=starttime, endtime=endtime, **catalog.download['restrictions'])
-        mdl = MassDownloader()
-        
-        mdl.download(GlobalDomain(), rst,
-            threads_per_client=catalog.download.get('threads') or 3,
-            mseed_storage=node.path('mseed'),
-            stationxml_storage=node.path('xml'))
-    
-    except:
-        node.write(format_exc(), 'error_download.log')
+    # check data length and gaps of each channel
+    for cha in chas:
+        traces = st.select(location=loc, channel=cha)
+        length = sum(tr.stats.npts * tr.stats.delta for tr in traces)
+
+        if len(traces) == 0 or length < (rst.get('minimum_length') or 0) * (endtime - starttime) or \
+            (rst.get('reject_channels_with_gaps') and len(traces) > 1):
+            _write_manifest(event, station, 'rejected')
+            return
+
+    t1 = starttime.strftime('%Y%m%dT%H%M%SZ')
+    t2 = endtime.strftime('%Y%m%dT%H%M%SZ')
+
+    for cha in chas:
+        st.select(location=loc, channel=cha).write(
+            root.path(f'downloads/{event}/mseed/{station}.{loc}.{cha}__{t1}__{t2}.mseed'), format='MSEED')
+
+    # StationXML is downloaded once per station epoch and shared by all events
+    if (digest := find_station(station, starttime)) is None:
+        inv = _client().get_stations(network=net, station=sta.code, starttime=starttime, endtime=endtime, level='response')
+
+        for s in inv[0]:
+            d = store_station(net, s)
+
+            if (s.start_date is None or s.start_date <= starttime) and (s.end_date is None or starttime < s.end_date):
+                digest = d
+
+    if digest is None:
+        _write_manifest(event, station, 'nodata')
+        return
+
+    add_reference(event, station, digest)
+    _write_manifest(event, station, 'done')
 
 
 def convert_h5(arg):
     from traceback import format_exc
     from nnodes import root
     from pyasdf import ASDFDataSet
-    from obspy import read, read_events
+    from concurrent.futures import ThreadPoolExecutor
+    from obspy import read_events, Stream, Inventory
+    from sebox.catalog import catalog
     from .index import format_station
+    from .inventory import load_event
 
     event = arg[0]
     node = root.subdir(arg[1])
@@ -69,40 +263,98 @@ def convert_h5(arg):
     if node.has('error_download.log'):
         return
 
-    with ASDFDataSet(node.path(f'{event}.h5'), mode='w', mpi=False, compression=None) as ds:
+    # errors are written to error.log once at the end
+    errors = []
+
+    with ASDFDataSet(node.path(f'{event}.h5'), mode='w', mpi=False, compression=None) as ds, \
+        ThreadPoolExecutor(max_workers=catalog.download.get('concurrency') or 8) as pool:
         try:
             ds.add_quakeml(read_events(node.path(f'../../events/{event}')))
         
         except Exception:
-            node.write(format_exc(), 'error.log', 'a')
+            errors.append(format_exc())
 
-        stations = set()
+        invs = load_event(event)
+        mseeds = _index_mseed(node.path('mseed'))
+        stations = list(mseeds)
         station_lines = ''
+        inv = Inventory([], source='sebox')
 
-        for src in node.ls(f'mseed'):
-            station = '.'.join(src.split('.')[:2])
-            stations.add(station)
+        for i in range(0, len(stations), _ingest_batch):
+            # read mseed files of a batch of stations in parallel and write them at once
+            batch = stations[i: i + _ingest_batch]
+            streams = list(pool.map(lambda sta: _read_mseeds(node, mseeds[sta], errors), batch))
 
             try:
-                ds.add_waveforms(read(node.path(f'mseed/{src}')), 'raw_obs')
+                ds.add_waveforms(Stream([tr for st in streams for tr in st]), 'raw_obs')
 
             except Exception:
-                node.write(format_exc(), 'error.log', 'a')
+                # write stations one by one so that a bad station does not affect the rest of the batch
+                # (traces already written by the failed call are skipped by pyasdf)
+                for station, stream in zip(batch, streams):
+                    try:
+                        ds.add_waveforms(stream, 'raw_obs')
+
+                    except Exception:
+                        errors.append(f'{station}\n{format_exc()}')
         
         for station in stations:
             try:
-                ds.add_stationxml(node.path(f'xml/{station}.xml'))
-                sta = ds.waveforms[station].StationXML.networks[0].stations[0] # type: ignore
+                inv += invs[station]
+                sta = invs[station].networks[0].stations[0]
                 ll = station.split('.')
                 ll.reverse()
                 ll += [f'{sta.latitude:.4f}', f'{sta.longitude:.4f}', f'{sta.elevation:.1f}', f'{sta.channels[0].depth:.1f}']
                 station_lines += format_station(ll)
             
             except Exception:
-                node.write(format_exc(), 'error.log', 'a')
+                errors.append(format_exc())
+
+        try:
+            ds.add_stationxml(inv)
+
+        except Exception:
+            errors.append(format_exc())
         
         node.write(station_lines, f'STATIONS.{event}')
 
+    if len(errors):
+        node.write(''.join(errors), 'error.log', 'a')
+
+
+# number of stations read in parallel and written to ASDF at once in convert_h5
+_ingest_batch = 200
+
+
+def _read_mseeds(node, srcs, errors):
+    """Read mseed files of a station and collect errors."""
+    from traceback import format_exc
+    from obspy import read, Stream
+
+    stream = Stream()
+
+    for src in srcs:
+        try:
+            stream += read(node.path(f'mseed/{src}'))
+
+        except Exception:
+            errors.append(format_exc())
+
+    return stream
+
+
+def _index_mseed(src):
+    """Mseed files in a directory grouped by network.station (listed once by each caller and passed on)."""
+    from nnodes import root
+
+    index = {}
+
+    if root.has(src):
+        for f in root.ls(src):
+            index.setdefault('.'.join(f.split('.')[:2]), []).append(f)
+
+    return index
+
 
 def convert_bp(node):
     events = node.ls('events')
@@ -125,42 +377,166 @@ def convert_bp_(node):
 
 
 def _convert_bp(event, mode):
-    from nnodes import root
     from pyasdf import ASDFDataSet
     from seisbp import SeisBP
-    from obspy import read_events, read, Stream
+    from obspy import read_events
+    from .inventory import load_event
 
     tag = 'raw_obs' if mode == 'obs' else 'synthetic'
 
     with ASDFDataSet(f'../ns/raw_{mode}/{event}.h5', mode='r', mpi=False) as h5, \
         SeisBP(f'bp_{mode}/{event}.bp', 'w') as bp:
         bp.write(read_events(f'events/{event}'))
-        invs = root.load(f'inventories/{event}.pickle')
-        stas = h5.waveforms.list()
+        invs = load_event(event)
+        stas = set(h5.waveforms.list())
+        mseeds = _index_mseed(f'downloads/{event}/mseed')
 
         for sta, inv in invs.items():
-            if sta not in stas or tag not in h5.waveforms[sta].get_waveform_tags():
-                traces = []
-
-                for src in root.ls(f'downloads/{event}/mseed'):
-                    if src.startswith(sta + '.'):
-                        try:
-                            traces.append(read(f'downloads/{event}/mseed/{src}')[0])
-                        
-                        except:
-                            pass
-                
-                if len(traces):
-                    print('@', sta)
-                    bp.write(Stream(traces))
-                    bp.write(inv)
-                
-                else:
-                    print('>', event, sta)
+            if (stream := _raw_stream(h5, stas, tag, event, sta, mseeds)) is not None:
+                bp.write(stream)
+                bp.write(inv)
             
             else:
-                bp.write(h5.waveforms[sta][tag])
-                bp.write(inv)
+                print('>', event, sta)
+
+
+def _raw_stream(h5, stas, tag, event, sta, mseeds):
+    """Raw data of a station from ASDF file, or from downloaded mseed files (mseeds from _index_mseed) if it is not in ASDF file."""
+    if sta in stas and tag in h5.waveforms[sta].get_waveform_tags():
+        return h5.waveforms[sta][tag]
+
+    if len(stream := _read_station([f'downloads/{event}/mseed/{src}' for src in mseeds.get(sta, [])])):
+        print('@', sta)
+        return stream
+
+
+def _read_station(srcs):
+    """First trace of each mseed file of a station (one channel per file), read in one call."""
+    from io import BytesIO
+    from warnings import catch_warnings, simplefilter
+    from obspy import read, Stream
+
+    if len(srcs) == 0:
+        return Stream()
+
+    first = {}
+
+    try:
+        # mseed records of concatenated files are read as a single stream
+        data = []
+
+        for src in srcs:
+            with open(src, 'rb') as f:
+                data.append(f.read())
+
+        with catch_warnings():
+            simplefilter('ignore')
+            stream = read(BytesIO(b''.join(data)), format='MSEED')
+
+        for tr in stream:
+            first.setdefault(tr.id, tr)
+
+    except Exception:
+        pass
+
+    if len(first) == len(srcs):
+        return Stream(list(first.values()))
+
+    # a corrupted file shifts the records after it, read files one by one to skip it
+    traces = []
+
+    for src in srcs:
+        try:
+            traces.append(read(src)[0])
+
+        except Exception:
+            pass
+
+    return Stream(traces)
+
+
+def convert_bp_sharded(node):
+    """Convert events to BP with stations split across ranks."""
+    from .ledger import Ledger
+
+    node.concurrent = True
+    mode = node.mode or 'obs'
+
+    # events with unmerged shards are only known from the ledger
+    for event in Ledger(f'convert_{mode}').remaining(node.ls('events'), lambda e: node.has(f'bp_{mode}/{e}.bp')):
+        node.add(convert_event, name=event, event=event, mode=mode)
+
+
+def convert_event(node):
+    """Write shards of an event and merge them if merge_shards is set."""
+    from .inventory import load_event
+
+    stas = list(load_event(node.event))
+    node.mkdir(dst := f'bp_{node.mode}/{node.event}')
+
+    if node.has(f'{dst}/complete'):
+        # marker of a previous run that failed before merging
+        node.rm(f'{dst}/complete')
+
+    node.add_mpi(_convert_shard, node.np, args=(node.event, node.mode), mpiarg=stas, group_mpiarg=True)
+    node.add(merge_event, args=(node.event, node.mode))
+
+
+def merge_event(event, mode):
+    """Merge shards of an event into a single BP file (shards are kept and read through ShardedBP otherwise)."""
+    from nnodes import root
+    from sebox.catalog import catalog
+    from .ledger import Ledger
+    from .shard import merge
+
+    dst = f'bp_{mode}/{event}'
+
+    if not root.has(f'{dst}/complete'):
+        raise RuntimeError(f'incomplete shards of {event}')
+
+    if catalog.download.get('merge_shards', True):
+        merge(dst, f'{dst}.bp')
+        root.rm(dst)
+
+    Ledger(f'convert_{mode}').mark(event)
+
+
+def _convert_shard(stas, event, mode):
+    from nnodes import root
+    from pyasdf import ASDFDataSet
+    from seisbp import SeisBP
+    from obspy import read_events
+    from .inventory import load_event
+
+    tag = 'raw_obs' if mode == 'obs' else 'synthetic'
+    shard = f'bp_{mode}/{event}/{root.mpi.rank:04d}'
+    written = []
+
+    with ASDFDataSet(f'../ns/raw_{mode}/{event}.h5', mode='r', mpi=False) as h5, SeisBP(f'{shard}.bp', 'w') as bp:
+        if root.mpi.rank == 0:
+            bp.write(read_events(f'events/{event}'))
+
+        invs = load_event(event)
+        h5_stas = set(h5.waveforms.list())
+        mseeds = _index_mseed(f'downloads/{event}/mseed')
+
+        for sta in stas:
+            if (stream := _raw_stream(h5, h5_stas, tag, event, sta, mseeds)) is not None:
+                bp.write(stream)
+                bp.write(invs[sta])
+                written.append(sta)
+
+            else:
+                print('>', event, sta)
+
+    # index is written last so that an incomplete shard is not listed
+    root.writelines(written, f'{shard}.txt')
+
+    # wait for all ranks, the event is complete only if every shard is written
+    nshards = root.mpi.comm.gather(len(written), root=0)
+
+    if root.mpi.rank == 0:
+        root.write(str(len(nshards)), f'bp_{mode}/{event}/complete')
 
 
 def __convert_bp_(stas, event, mode):
@@ -168,13 +544,14 @@ def __convert_bp_(stas, event, mode):
     from pyasdf import ASDFDataSet
     from seisbp import SeisBP
     from obspy import read_events
+    from .inventory import load_event
 
     with ASDFDataSet(f'../ns/raw_{mode}/{event}.h5', mode='r', mpi=False) as h5, \
         SeisBP(f'bp_{mode}/{event}.bp', 'w') as bp:
         if root.mpi.rank == 0:
             bp.write(read_events(f'events/{event}'))
 
-        invs = root.load(f'inventories/{event}.pickle')
+        invs = load_event(event)
         stas2 = h5.waveforms.list()
 
         for sta in stas:
@@ -196,12 +573,13 @@ def _convert_bp_(stas, event):
     from pyasdf import ASDFDataSet
     from seisbp import SeisBP
     from obspy import read_events
+    from .inventory import load_event
     with ASDFDataSet(f'raw_obs/{event}.h5', mode='r', mpi=False) as h5, \
         SeisBP(f'bp_obs/{event}.bp', 'w', True) as bp:
         if root.mpi.rank == 0:
             bp.write(read_events(f'events/{event}'))
 
-        invs = root.load(f'inventories/{event}.pickle')
+        invs = load_event(event)
 
         for sta in stas:
             bp.write(invs[sta])
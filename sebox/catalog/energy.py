@@ -0,0 +1,74 @@
+import typing as tp
+
+import numpy as np
+
+
+def cumulative(data: np.ndarray) -> np.ndarray:
+    """Cumulative energy along the last axis with a leading zero, energy of [l, r) is c[..., r] - c[..., l]."""
+    data = np.asarray(data, dtype=float)
+    c = np.zeros(data.shape[:-1] + (data.shape[-1] + 1,))
+    np.cumsum(data ** 2, axis=-1, out=c[..., 1:])
+
+    return c
+
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    # zero energy (e.g. identical obs and syn) gives a ratio of zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den > 0, num / np.where(den > 0, den, 1), 0.0)
+
+
+class Energy:
+    """Energy of obs, syn and their difference in any set of sample ranges.
+
+    Traces are stacked as [ntraces, npts] (a single trace is [npts]), a query is answered in O(1)."""
+    # cumulative energy of obs, syn and syn - obs
+    obs: np.ndarray
+    syn: np.ndarray
+    diff: np.ndarray
+
+    def __init__(self, obs: np.ndarray, syn: np.ndarray):
+        obs = np.atleast_2d(np.asarray(obs, dtype=float))
+        syn = np.atleast_2d(np.asarray(syn, dtype=float))
+
+        self.obs = cumulative(obs)
+        self.syn = cumulative(syn)
+        self.diff = cumulative(syn - obs)
+
+    @property
+    def npts(self) -> int:
+        return self.obs.shape[-1] - 1
+
+    def query(self, kind: tp.Literal['obs', 'syn', 'diff'], left, right, trace=0) -> np.ndarray:
+        """Energy of samples [left, right) of traces, arguments are scalars or arrays of the same shape."""
+        c = getattr(self, kind)
+        left = np.clip(left, 0, self.npts)
+        right = np.clip(right, 0, self.npts)
+
+        return np.maximum(c[trace, right] - c[trace, left], 0.0)
+
+    def total(self, kind: tp.Literal['obs', 'syn', 'diff'], trace=0) -> np.ndarray:
+        """Energy of whole traces."""
+        return getattr(self, kind)[trace, -1]
+
+    def mean(self, kind: tp.Literal['obs', 'syn', 'diff'], left, right, trace=0) -> np.ndarray:
+        """Mean energy per sample in [left, right)."""
+        return _ratio(self.query(kind, left, right, trace), np.asarray(right) - np.asarray(left))
+
+    def ratios(self, left, right, trace=None) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Fraction of energy of obs, syn and diff inside windows [left, right), summed per trace.
+
+        Windows belong to trace index `trace` (default 0); returns arrays of length ntraces,
+        compared with threshold_obs, threshold_syn and threshold_diff in catalog.toml."""
+        left = np.asarray(left, dtype=int).ravel()
+        right = np.asarray(right, dtype=int).ravel()
+        trace = np.zeros(len(left), dtype=int) if trace is None else np.asarray(trace, dtype=int).ravel()
+        ntraces = self.obs.shape[0]
+
+        output = []
+
+        for kind in ('obs', 'syn', 'diff'):
+            e = np.bincount(trace, self.query(kind, left, right, trace), minlength=ntraces)
+            output.append(_ratio(e, getattr(self, kind)[:, -1]))
+
+        return output[0], output[1], output[2]
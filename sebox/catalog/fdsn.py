@@ -0,0 +1,248 @@
+import typing as tp
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+if tp.TYPE_CHECKING:
+    from obspy import Stream, Inventory
+
+
+class _Requests:
+    """Number of requests being served and the largest number served at once."""
+    def __init__(self):
+        from threading import Lock
+
+        self.lock = Lock()
+        self.active = 0
+        self.peak = 0
+        self.total = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.active += 1
+            self.total += 1
+            self.peak = max(self.peak, self.active)
+
+    def __exit__(self, *args):
+        with self.lock:
+            self.active -= 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Handler of FDSN station and dataselect queries."""
+    # StationXML of all stations
+    inventory: 'Inventory'
+
+    # waveforms of all stations
+    stream: 'Stream'
+
+    # requests served by this server
+    requests: _Requests
+
+    # seconds added to each request so that concurrent requests overlap
+    delay: float
+
+    def do_GET(self):
+        from time import sleep
+
+        with self.requests:
+            sleep(self.delay)
+            self._get()
+
+    def do_POST(self):
+        from time import sleep
+
+        with self.requests:
+            sleep(self.delay)
+            self._post()
+
+    def _get(self):
+        from urllib.parse import urlparse, parse_qs
+
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path.endswith('/version'):
+            self._send(b'1.1.0', 'text/plain')
+
+        elif url.path.endswith('/station/1/query'):
+            self._station(query)
+
+        elif url.path.endswith('/dataselect/1/query'):
+            self._dataselect([(query.get('network', query.get('net', '*')), query.get('station', query.get('sta', '*')),
+                query.get('location', query.get('loc', '*')), query.get('channel', query.get('cha', '*')),
+                query.get('starttime', query.get('start')), query.get('endtime', query.get('end')))])
+
+        else:
+            self.send_error(404)
+
+    def _post(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+
+        if self.path.endswith('/dataselect/1/query'):
+            # bulk request with one "NET STA LOC CHA START END" line per channel
+            lines = [tuple(line.split()) for line in body.splitlines() if len(line.split()) == 6]
+            self._dataselect(lines)
+
+        elif self.path.endswith('/station/1/query'):
+            lines = [line.split() for line in body.splitlines() if len(line.split()) == 6]
+            self._station({'network': ','.join(ll[0] for ll in lines), 'station': ','.join(ll[1] for ll in lines)})
+
+        else:
+            self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, data: bytes, content_type: str):
+        if len(data) == 0:
+            # FDSN response for no data
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _station(self, query: tp.Dict[str, str]):
+        from io import BytesIO
+        from obspy import Inventory, UTCDateTime
+
+        inv = Inventory([], source='sebox')
+        start = query.get('starttime', query.get('start'))
+        end = query.get('endtime', query.get('end'))
+
+        for net in query.get('network', query.get('net', '*')).split(','):
+            for sta in query.get('station', query.get('sta', '*')).split(','):
+                for cha in query.get('channel', query.get('cha', '*')).split(','):
+                    inv += self.inventory.select(network=net, station=sta, channel=cha,
+                        starttime=UTCDateTime(start) if start else None, endtime=UTCDateTime(end) if end else None)
+
+        if len(inv.networks) == 0:
+            self._send(b'', 'application/xml')
+            return
+
+        buf = BytesIO()
+        inv.write(buf, format='STATIONXML')
+        self._send(buf.getvalue(), 'application/xml')
+
+    def _dataselect(self, lines: tp.List[tuple]):
+        from io import BytesIO
+        from obspy import Stream, UTCDateTime
+
+        st = Stream()
+
+        for net, sta, loc, cha, start, end in lines:
+            t1 = UTCDateTime(start)
+            t2 = UTCDateTime(end)
+            st += self.stream.select(network=net, station=sta, location='' if loc == '--' else loc,
+                channel=cha).slice(t1, t2).copy()
+
+        if len(st) == 0:
+            self._send(b'', 'application/vnd.fdsn.mseed')
+            return
+
+        buf = BytesIO()
+        st.write(buf, format='MSEED')
+        self._send(buf.getvalue(), 'application/vnd.fdsn.mseed')
+
+
+def serve(src: str, port: int = 0, delay: float = 0.0) -> ThreadingHTTPServer:
+    """Serve mseed files in {src}/mseed and StationXML files in {src}/xml as a local FDSN web service."""
+    from os import listdir
+    from threading import Thread
+    from obspy import read, read_inventory, Inventory, Stream
+
+    inv = Inventory([], source='sebox')
+    st = Stream()
+
+    for f in sorted(listdir(f'{src}/xml')):
+        inv += read_inventory(f'{src}/xml/{f}')
+
+    for f in sorted(listdir(f'{src}/mseed')):
+        st += read(f'{src}/mseed/{f}')
+
+    handler = type('Handler', (_Handler,), {'inventory': inv, 'stream': st, 'requests': _Requests(), 'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    """URL to pass to obspy FDSN client or [download] provider in catalog.toml."""
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def check(dst: str, nevents: int = 3, nstations: int = 10, delay: float = 0.1) -> str:
+    """Download a synthetic catalog from a local server with request_events, check the request cap and manifests."""
+    from os import chdir, getcwd, listdir, makedirs
+    from shutil import copyfile
+    from sebox.catalog import catalog
+    from .benchmark import generate
+    from .download import request_events, _read_manifest
+
+    # one synthetic event is served and requested under several event names
+    generate(f'{dst}/data', 1, nstations, (20.0,), ('sts2',))
+    server = serve(f'{dst}/data/downloads/C00000000A', delay=delay)
+    events = [f'C{i:08d}A' for i in range(nevents)]
+    makedirs(f'{dst}/run/events', exist_ok=True)
+
+    for event in events:
+        copyfile(f'{dst}/data/events/C00000000A', f'{dst}/run/events/{event}')
+
+    # provider is set in memory only, catalog.toml is not modified
+    catalog.download['provider'] = base_url(server)
+    cap = catalog.download.get('concurrency') or 8
+    cwd = getcwd()
+
+    try:
+        # request_events writes output relative to the working directory
+        chdir(f'{dst}/run')
+        request_events(events)
+        manifests = {event: _read_manifest(event) for event in events}
+        nfiles = {event: len(listdir(f'downloads/{event}/mseed')) for event in events}
+
+    finally:
+        chdir(cwd)
+        server.shutdown()
+
+    requests = server.RequestHandlerClass.requests
+    lines = [f'{requests.total} requests, at most {requests.peak} at once (concurrency = {cap})']
+
+    if requests.peak > cap:
+        raise RuntimeError(f'{requests.peak} simultaneous requests exceed concurrency = {cap}')
+
+    for event, (stations, complete) in manifests.items():
+        status = {s: stations.get(s) for s in stations if s != '*'}
+
+        if not complete:
+            raise RuntimeError(f'{event}: manifest.txt has no complete line')
+
+        if len(status) != nstations or any(v not in ('done', 'nodata', 'rejected') for v in status.values()):
+            raise RuntimeError(f'{event}: manifest.txt does not list all {nstations} stations')
+
+        ndone = sum(v == 'done' for v in status.values())
+
+        if ndone == 0 or nfiles[event] != 3 * ndone:
+            raise RuntimeError(f'{event}: {nfiles[event]} mseed files for {ndone} downloaded stations')
+
+        lines.append(f'{event}: ' + ', '.join(f'{sum(v == k for v in status.values())} {k}'
+            for k in ('done', 'nodata', 'rejected')))
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from tempfile import mkdtemp
+
+    parser = ArgumentParser(description='Download a synthetic catalog from a local FDSN server with request_events.')
+    parser.add_argument('--events', type=int, default=3, help='number of events')
+    parser.add_argument('--stations', type=int, default=10, help='number of stations per event')
+    parser.add_argument('--delay', type=float, default=0.1, help='seconds added to each request')
+    parser.add_argument('--dir', default=None, help='directory of the synthetic catalog (default: temporary directory)')
+    args = parser.parse_args()
+
+    print(check(args.dir or mkdtemp(prefix='sebox_fdsn_'), args.events, args.stations, args.delay))
@@ -0,0 +1,659 @@
+import typing as tp
+
+import numpy as np
+
+from .screen import data_quality
+
+if tp.TYPE_CHECKING:
+    from obspy import Trace
+
+
+# default parameters of pyflex.Config
+defaults = {
+    'stalta_waterlevel': 0.07,
+    'tshift_acceptance_level': 10.0,
+    'tshift_reference': 0.0,
+    'dlna_acceptance_level': 1.3,
+    'dlna_reference': 0.0,
+    'cc_acceptance_level': 0.7,
+    's2n_limit': 1.5,
+    'earth_model': 'ak135',
+    'min_surface_wave_velocity': 3.0,
+    'max_time_before_first_arrival': 50.0,
+    'c_0': 1.0,
+    'c_1': 1.5,
+    'c_2': 0.0,
+    'c_3a': 4.0,
+    'c_3b': 2.5,
+    'c_4a': 2.0,
+    'c_4b': 6.0,
+    'check_global_data_quality': False,
+    'snr_integrate_base': 3.5,
+    'snr_max_base': 3.0,
+    'noise_start_index': 0,
+    'noise_end_index': None,
+    'signal_start_index': None,
+    'signal_end_index': -1,
+    'window_signal_to_noise_type': 'amplitude',
+    'resolution_strategy': 'interval_scheduling'
+}
+
+# fields of selected windows (same meaning as pyflex.Window)
+dtype = np.dtype([('left', 'i8'), ('right', 'i8'), ('center', 'i8'),
+    ('max_cc_value', 'f8'), ('cc_shift', 'i8'), ('dlnA', 'f8')])
+
+# maximum number of (window, sample) pairs evaluated at once
+_chunk = 1 << 22
+
+
+def envelope(data: np.ndarray) -> np.ndarray:
+    """Envelope of traces [..., npts] (same as obspy.signal.filter.envelope)."""
+    from scipy.fft import rfft, irfft
+
+    n = data.shape[-1]
+    spec = rfft(data, axis=-1)
+
+    # Hilbert transform without DC and Nyquist components
+    spec[..., 0] = 0
+    if n % 2 == 0:
+        spec[..., -1] = 0
+
+    hilb = irfft(spec * 1j, n=n, axis=-1)
+
+    return np.sqrt(data ** 2 + hilb ** 2)
+
+
+def sta_lta(data: np.ndarray, dt: float, min_period: float) -> np.ndarray:
+    """STA/LTA of traces [..., npts] (same as pyflex.stalta.sta_lta)."""
+    from scipy.signal import lfilter
+
+    cs = 10 ** (-dt / min_period)
+    cl = 10 ** (-dt / (12 * min_period))
+    noise = data.max(axis=-1, keepdims=True) / 1e5
+
+    # 1000 samples to warm up STA/LTA
+    ext = np.zeros(data.shape[:-1] + (data.shape[-1] + 1000,))
+    ext += noise
+    ext[..., -data.shape[-1]:] += data
+
+    sta = lfilter([1.0], [1.0, -cs], ext, axis=-1)
+    lta = lfilter([1.0], [1.0, -cl], ext, axis=-1)
+    sta /= lta
+
+    # avoid division by very small values
+    sta = np.where(lta < 1e-9, np.broadcast_to(noise, lta.shape), sta)
+
+    return sta[..., -data.shape[-1]:]
+
+
+def extrema(data: np.ndarray) -> tp.List[tp.Tuple[np.ndarray, np.ndarray]]:
+    """Local maxima and minima of traces [ntraces, npts] (same as pyflex.utils.find_local_extrema)."""
+    diff = np.diff(data, axis=-1)
+    mid = data[:, 1:-1]
+    maxs = (mid > data[:, :-2]) & (mid > data[:, 2:])
+    mins = (mid < data[:, :-2]) & (mid < data[:, 2:])
+    output = []
+
+    for i in range(len(data)):
+        maxima = np.nonzero(maxs[i])[0] + 1
+        minima = np.nonzero(mins[i])[0] + 1
+        flats = np.nonzero(diff[i] == 0)[0]
+
+        if len(flats):
+            # first index of flat extrema, rare in STA/LTA so a loop is fine
+            fmax, fmin = _flat_extrema(diff[i], flats)
+            maxima = np.union1d(maxima, fmax)
+            minima = np.union1d(minima, fmin)
+
+        output.append((maxima.astype(np.int64), minima.astype(np.int64)))
+
+    return output
+
+
+def _flat_extrema(diff: np.ndarray, flats: np.ndarray) -> tp.Tuple[tp.List[int], tp.List[int]]:
+    # first flat of each run of neighbouring flats
+    flats = [flats[0]] + [j for i, j in zip(flats[:-1], flats[1:]) if j - i != 1]
+    maxima = []
+    minima = []
+
+    for idx in flats:
+        l_type = 'left'
+        r_type = 'right'
+
+        # negative indices wrap around as in pyflex
+        i = idx - 1
+        while True:
+            if diff[i] < 0:
+                l_type = 'minima'
+                break
+
+            if diff[i] > 0:
+                l_type = 'maxima'
+                break
+
+            i -= 1
+
+        for i in range(idx + 1, len(diff)):
+            if diff[i] < 0:
+                r_type = 'maxima'
+                break
+
+            if diff[i] > 0:
+                r_type = 'minima'
+                break
+
+        if r_type == l_type:
+            (maxima if r_type == 'maxima' else minima).append(int(idx))
+
+    return maxima, minima
+
+
+def _pairs(start: np.ndarray, end: np.ndarray) -> tp.Iterator[tp.Tuple[np.ndarray, np.ndarray]]:
+    """Indices (item, position) of all positions in [start, end) of each item, in chunks."""
+    counts = np.maximum(end - start, 0)
+    cum = np.cumsum(counts)
+    i0 = 0
+
+    while i0 < len(counts):
+        base = cum[i0 - 1] if i0 else 0
+        i1 = max(int(np.searchsorted(cum, base + _chunk, 'right')), i0 + 1)
+        c = counts[i0: i1]
+        item = np.repeat(np.arange(i0, i1), c)
+        pos = np.arange(len(item)) - np.repeat(np.cumsum(c) - c, c) + np.repeat(start[i0: i1], c)
+        yield item, pos
+        i0 = i1
+
+
+def _range_min(values: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Minimum of values[start: end] of each range (inf for empty ranges)."""
+    out = np.full(len(start), np.inf)
+
+    for item, pos in _pairs(start, end):
+        np.minimum.at(out, item, values[pos])
+
+    return out
+
+
+class _SparseMax:
+    """Range maximum queries in O(1) after O(n log n) setup."""
+    def __init__(self, values: np.ndarray):
+        self.levels = [values]
+
+        while 2 ** len(self.levels) <= len(values):
+            prev = self.levels[-1]
+            h = 2 ** (len(self.levels) - 1)
+            self.levels.append(np.maximum(prev[:-h], prev[h:]))
+
+    def query(self, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+        """Maximum of values[start: end], ranges must not be empty."""
+        k = np.floor(np.log2(end - start)).astype(int)
+        out = np.empty(len(start))
+
+        for lvl in np.unique(k):
+            m = k == lvl
+            v = self.levels[lvl]
+            out[m] = np.maximum(v[start[m]], v[end[m] - 2 ** lvl])
+
+        return out
+
+
+def _xcorr(obs: np.ndarray, syn: np.ndarray, left: np.ndarray, right: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+    """Maximum normalized cross correlation and its lag of obs and syn in [left, right] (same as pyflex.Window)."""
+    from scipy.fft import rfft, irfft, next_fast_len
+
+    cc = np.zeros(len(left))
+    shift = np.zeros(len(left), dtype=np.int64)
+    c_obs = np.concatenate([[0], np.cumsum(obs ** 2)])
+    c_syn = np.concatenate([[0], np.cumsum(syn ** 2)])
+
+    # windows with similar lengths are transformed together
+    order = np.argsort(right - left)
+
+    for chunk in np.array_split(order, max(1, int(np.sum(right - left + 1) * 4 // _chunk) + 1)):
+        if len(chunk) == 0:
+            continue
+
+        l = left[chunk]
+        r = right[chunk]
+        n = r - l + 1
+        nmax = int(n.max())
+        nfft = next_fast_len(2 * nmax - 1, True)
+
+        idx = l[:, np.newaxis] + np.arange(nmax)
+        valid = np.arange(nmax) < n[:, np.newaxis]
+        idx = np.where(valid, idx, 0)
+        d = np.where(valid, obs[idx], 0.0)
+        s = np.where(valid, syn[idx], 0.0)
+
+        # r[lag] = sum(d[i + lag] * s[i])
+        corr = irfft(rfft(d, nfft, axis=-1) * np.conj(rfft(s, nfft, axis=-1)), nfft, axis=-1)
+        full = np.concatenate([corr[:, nfft - nmax + 1:], corr[:, :nmax]], axis=-1)
+        lags = np.arange(-nmax + 1, nmax)
+        full = np.where(np.abs(lags) < n[:, np.newaxis], full, -np.inf)
+
+        k = np.argmax(full, axis=-1)
+        norm = np.sqrt((c_syn[r + 1] - c_syn[l]) * (c_obs[r + 1] - c_obs[l]))
+        cc[chunk] = full[np.arange(len(chunk)), k] / norm
+        shift[chunk] = lags[k]
+
+    return cc, shift
+
+
+def _schedule(left: np.ndarray, right: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """Indices of windows selected by weighted interval scheduling (same as pyflex.interval_scheduling)."""
+    order = np.argsort(right, kind='stable')
+    left = left[order]
+    right = right[order]
+    weight = weight[order]
+    p = np.searchsorted(right, left, 'right') - 1
+
+    n = len(order)
+    opt = np.zeros(n + 1)
+
+    # opt[j + 1] is OPT[j] of pyflex, OPT[0] is 0 in pyflex
+    for j in range(1, n):
+        opt[j + 1] = max(weight[j] + opt[p[j] + 1], opt[j])
+
+    selected = []
+    j = n - 1
+
+    while j >= 0:
+        if weight[j] + opt[p[j] + 1] > opt[j]:
+            selected.append(j)
+            j = p[j]
+
+        else:
+            j -= 1
+
+    # sorted by right as in pyflex
+    return order[np.sort(np.array(selected, dtype=int))]
+
+
+def _tags(left: np.ndarray, right: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    """Windows sharing (left, right) with a kept window (pyflex rejects windows by their bounds, not their centers)."""
+    key = left.astype(np.int64) * (1 << 32) + right
+
+    return np.isin(key, key[keep])
+
+
+def _select(obs: np.ndarray, syn: np.ndarray, stalta: np.ndarray, peaks: np.ndarray, troughs: np.ndarray,
+    dt: float, cfg: dict, first: float, offset: float, dist: float) -> np.ndarray:
+    """Select windows of a single trace."""
+    empty = np.zeros(0, dtype=dtype)
+    min_period = cfg['min_period']
+    waterlevel = cfg['stalta_waterlevel']
+
+    if not len(peaks) or not len(troughs) or first is None:
+        return empty
+
+    # restrict extrema to the range given by travel times
+    min_idx = int((first - cfg['max_time_before_first_arrival'] + offset) / dt)
+    max_idx = int((dist / cfg['min_surface_wave_velocity'] + offset + cfg['max_period']) / dt)
+    ft, lt = troughs[0], troughs[-1]
+    troughs = troughs[(troughs >= min_idx) & (troughs <= max_idx)]
+
+    if not len(troughs):
+        return empty
+
+    if ft != troughs[0]:
+        troughs = np.concatenate([[min_idx], troughs])
+
+    if lt != troughs[-1]:
+        troughs = np.concatenate([troughs, [max_idx]])
+
+    if troughs[-1] >= len(stalta):
+        return empty
+
+    peaks = peaks[(peaks > troughs[0]) & (peaks < troughs[-1])]
+
+    # initial windows: every pair of troughs around a peak above water level
+    centers = peaks[stalta[peaks] > waterlevel]
+    nl = np.searchsorted(troughs, centers, 'left')
+    nr = len(troughs) - np.searchsorted(troughs, centers, 'right')
+    count = nl * nr
+    center = np.repeat(centers, count)
+    k = np.arange(len(center)) - np.repeat(np.cumsum(count) - count, count)
+    nr_w = np.repeat(nr, count)
+    left = troughs[k // nr_w]
+    right = troughs[np.repeat(len(troughs) - nr, count) + k % nr_w]
+
+    # reject on travel times
+    keep = (right * dt >= first - min_period + offset) & (left * dt <= dist / cfg['min_surface_wave_velocity'] + offset)
+    left, right, center = left[keep], right[keep], center[keep]
+
+    noise_end = cfg['noise_end_index']
+    if noise_end is None:
+        noise_end = int(first - min_period)
+
+    signal_start = cfg['signal_start_index']
+    if signal_start is None:
+        signal_start = noise_end
+
+    noise = obs[cfg['noise_start_index']: noise_end]
+
+    if cfg['check_global_data_quality']:
+        snr_int, snr_amp, valid = data_quality(obs, [(cfg['noise_start_index'], noise_end)],
+            [(signal_start, cfg['signal_end_index'])])
+
+        if not valid[0] or snr_int[0] < cfg['snr_integrate_base'] or snr_amp[0] < cfg['snr_max_base']:
+            return empty
+
+    # minimum length
+    min_length = cfg['c_1'] * min_period / dt
+    keep = right - left >= min_length
+    left, right, center = left[keep], right[keep], center[keep]
+
+    # internal minima below water level
+    st = stalta[troughs]
+    m = _range_min(st, np.searchsorted(troughs, left, 'right'), np.searchsorted(troughs, right, 'left'))
+    keep = ~(m <= cfg['c_0'] * waterlevel)
+    left, right, center = left[keep], right[keep], center[keep]
+
+    # prominence of central peak
+    if cfg['c_2']:
+        il = np.searchsorted(troughs, center, 'left') - 1
+        ir = np.searchsorted(troughs, center, 'right')
+        ok = (il >= 0) & (ir < len(troughs))
+        c = stalta[center]
+        keep = ok & (c - st[np.clip(il, 0, len(st) - 1)] >= cfg['c_2'] * c) & \
+            (c - st[np.clip(ir, 0, len(st) - 1)] >= cfg['c_2'] * c)
+        keep = _tags(left, right, keep)
+        left, right, center = left[keep], right[keep], center[keep]
+
+    # phase separation
+    smin = _range_min(st, np.searchsorted(troughs, left, 'left'), np.searchsorted(troughs, right, 'right'))
+    d_center = stalta[center] - smin
+    reject = np.zeros(len(left), dtype=bool)
+
+    for item, pos in _pairs(np.searchsorted(peaks, left, 'left'), np.searchsorted(peaks, right, 'right')):
+        pk = peaks[pos]
+        d_time = np.abs(center[item] - pk) * dt / min_period
+        f_time = np.where(d_time >= cfg['c_3b'], np.exp(-((d_time - cfg['c_3b']) / cfg['c_3b']) ** 2), 1.0)
+        bad = (pk != center[item]) & (stalta[pk] - smin[item] > cfg['c_3a'] * d_center[item] * f_time)
+        reject[item[bad]] = True
+
+    keep = _tags(left, right, ~reject)
+    left, right, center = left[keep], right[keep], center[keep]
+
+    # curtail windows with long emergent start or coda
+    ps = np.searchsorted(peaks, left, 'left')
+    pe = np.searchsorted(peaks, right, 'right')
+    curtail = pe - ps - 1 >= 2
+    ps, pe = ps[curtail], pe[curtail]
+    c = center[curtail]
+    i_left = np.where(peaks[ps] != c, peaks[ps], peaks[np.minimum(ps + 1, len(peaks) - 1)])
+    i_right = np.where(peaks[pe - 1] != c, peaks[pe - 1], peaks[np.maximum(pe - 2, 0)])
+    tdl = min_period * cfg['c_4a'] / dt
+    tdr = min_period * cfg['c_4b'] / dt
+    left = left.copy()
+    right = right.copy()
+    left[curtail] = np.where(i_left - left[curtail] > tdl, (i_left - tdl).astype(np.int64), left[curtail])
+    right[curtail] = np.where(right[curtail] - i_right > tdr, (i_right + tdr).astype(np.int64), right[curtail])
+
+    # remove duplicates and sort by left
+    _, first_idx = np.unique(np.stack([left, right], axis=-1), axis=0, return_index=True)
+    first_idx = np.sort(first_idx)
+    left, right = left[first_idx], right[first_idx]
+    order = np.argsort(left, kind='stable')
+    left, right = left[order], right[order]
+    center = (left + (right - left) / 2).astype(np.int64)
+
+    keep = right - left >= min_length
+    left, right, center = left[keep], right[keep], center[keep]
+
+    if not len(left):
+        return empty
+
+    # signal to noise ratio
+    if np.any(noise):
+        if cfg['window_signal_to_noise_type'] == 'amplitude':
+            ratio = _SparseMax(np.abs(obs)).query(left, right) / np.abs(noise).max()
+
+        else:
+            c_obs = np.concatenate([[0], np.cumsum(obs ** 2)])
+            ratio = ((c_obs[right] - c_obs[left]) / (right - left)) / (np.sum(noise ** 2) / len(noise))
+
+        keep = ratio >= cfg['s2n_limit']
+        left, right, center = left[keep], right[keep], center[keep]
+
+    if not len(left):
+        return empty
+
+    # data fit criteria
+    cc, shift = _xcorr(obs, syn, left, right)
+    c_obs = np.concatenate([[0], np.cumsum(obs ** 2)])
+    c_syn = np.concatenate([[0], np.cumsum(syn ** 2)])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dlna = 0.5 * np.log((c_obs[right + 1] - c_obs[left]) / (c_syn[right + 1] - c_syn[left]))
+
+    tshift = shift * dt
+    tl = cfg['tshift_acceptance_level']
+    dl = cfg['dlna_acceptance_level']
+    keep = (cfg['tshift_reference'] - tl < tshift) & (tshift < cfg['tshift_reference'] + tl) & \
+        (cfg['dlna_reference'] - dl < dlna) & (dlna < cfg['dlna_reference'] + dl) & \
+        ~(cc < cfg['cc_acceptance_level'])
+    left, right, center, cc, shift, dlna = left[keep], right[keep], center[keep], cc[keep], shift[keep], dlna[keep]
+
+    if not len(left):
+        return empty
+
+    if cfg['resolution_strategy'] == 'merge':
+        left, right = _merge(left, right)
+        center = (left + (right - left) / 2).astype(np.int64)
+        cc, shift = _xcorr(obs, syn, left, right)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dlna = 0.5 * np.log((c_obs[right + 1] - c_obs[left]) / (c_syn[right + 1] - c_syn[left]))
+
+    else:
+        idx = _schedule(left, right, (right - left) * dt / min_period * cc)
+        left, right, center, cc, shift, dlna = left[idx], right[idx], center[idx], cc[idx], shift[idx], dlna[idx]
+
+    output = np.zeros(len(left), dtype=dtype)
+    output['left'] = left
+    output['right'] = right
+    output['center'] = center
+    output['max_cc_value'] = cc
+    output['cc_shift'] = shift
+    output['dlnA'] = dlna
+
+    return output
+
+
+def _merge(left: np.ndarray, right: np.ndarray) -> tp.Tuple[np.ndarray, np.ndarray]:
+    """Merge overlapping windows (same as resolution_strategy = "merge" of pyflex)."""
+    order = np.argsort(left, kind='stable')
+    ml = [left[order[0]]]
+    mr = [right[order[0]]]
+
+    for i in order[1:]:
+        if mr[-1] + 1 < left[i]:
+            ml.append(left[i])
+            mr.append(right[i])
+
+        else:
+            mr[-1] = right[i]
+
+    return np.array(ml), np.array(mr)
+
+
+def select_windows(obs: np.ndarray, syn: np.ndarray, dt: float, params: tp.Union[dict, tp.Sequence[dict]],
+    first: tp.Sequence[tp.Optional[float]], offset: tp.Sequence[float], dist: tp.Sequence[float]) -> tp.List[np.ndarray]:
+    """Select windows of traces [ntraces, npts] with the FLEXWIN criteria of pyflex.
+
+    params: keyword arguments of pyflex.Config (scalar values only), shared or one per trace
+    first: first arrival time after origin of each trace (None if unknown)
+    offset: origin time minus start time of each trace
+    dist: epicentral distance of each trace in km"""
+    obs = np.atleast_2d(np.asarray(obs, dtype=float))
+    syn = np.atleast_2d(np.asarray(syn, dtype=float))
+    cfgs = [{**defaults, **p} for p in ([params] * len(obs) if isinstance(params, dict) else params)]
+
+    # per-sample quantities of all traces at once (STA/LTA for each min_period)
+    env = envelope(syn)
+    stalta = np.empty_like(env)
+    min_periods = np.array([cfg['min_period'] for cfg in cfgs])
+
+    for min_period in np.unique(min_periods):
+        stalta[min_periods == min_period] = sta_lta(env[min_periods == min_period], dt, min_period)
+
+    ext = extrema(stalta)
+    output = []
+
+    for i, cfg in enumerate(cfgs):
+        try:
+            output.append(_select(obs[i], syn[i], stalta[i], ext[i][0], ext[i][1], dt, cfg, first[i], offset[i], dist[i]))
+
+        except (IndexError, ValueError):
+            # same as a failed pyflex selection
+            output.append(np.zeros(0, dtype=dtype))
+
+    return output
+
+
+def geometry(tr: 'Trace', evt: tp.Any, inv: tp.Any, model: str) -> tp.Tuple[tp.Optional[float], float, float]:
+    """First arrival time, origin time minus start time and distance in km of a trace."""
+    from obspy.geodetics import locations2degrees, calc_vincenty_inverse
+    from .ttimes import arrival_times, _taup
+    from sebox.catalog import catalog
+
+    origin = evt.preferred_origin() or evt.origins[0]
+    sta = inv.select(network=tr.stats.network, station=tr.stats.station)[0][0]
+
+    deg = locations2degrees(sta.latitude, sta.longitude, origin.latitude, origin.longitude)
+    dist = calc_vincenty_inverse(sta.latitude, sta.longitude, origin.latitude, origin.longitude)[0] / 1000
+    depth = origin.depth / 1000
+
+    tt = None
+
+    if model == catalog.window['flexwin']['default'].get('earth_model'):
+        tt = arrival_times(depth, deg)
+
+    if tt is not None:
+        first = tt[0]
+
+    else:
+        tts = _taup(model).get_travel_times(source_depth_in_km=depth, distance_in_degree=deg)
+        first = tts[0].time if len(tts) else None
+
+    return first, origin.time - tr.stats.starttime, dist
+
+
+def agreement(node):
+    """Compare windows selected by pyflex and the native selector on a subset of stations of each event."""
+    node.mkdir('agreement')
+    events = [e for e in node.ls('events') if node.has(f'proc_obs/{e}.bp') and node.has(f'proc_syn/{e}.bp')
+        and not node.has(f'agreement/{e}.npz')]
+
+    if len(events):
+        node.add_mpi(_compare, len(events), mpiarg=events)
+
+    node.add(report)
+
+
+def _match(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Index of the window in b overlapping most with each window in a (-1 if none)."""
+    if len(a) == 0 or len(b) == 0:
+        return np.full(len(a), -1)
+
+    overlap = np.minimum(a.right[:, np.newaxis], b.right) - np.maximum(a.left[:, np.newaxis], b.left) + 1
+    idx = np.argmax(overlap, axis=1)
+
+    return np.where(overlap[np.arange(len(a)), idx] > 0, idx, -1)
+
+
+def _compare(event):
+    """Select windows of an event with both selectors and save matched windows."""
+    from time import perf_counter
+    import logging
+    import warnings
+    from seisbp import SeisBP
+    from nnodes import root
+    from sebox.catalog import catalog
+    from .bands import band_plan, bands
+    from .window import _window
+
+    logging.disable()
+    warnings.filterwarnings('ignore')
+
+    plan = band_plan()
+    nstas = catalog.window.get('agreement_stations')
+    rows = []
+    pairs = []
+    elapsed = np.zeros(2)
+
+    with SeisBP(f'proc_obs/{event}.bp', 'r') as obs_bp, SeisBP(f'proc_syn/{event}.bp', 'r') as syn_bp:
+        evt = syn_bp.read(syn_bp.events[0])
+
+        for sta in list(syn_bp.stations)[:nstas]:
+            inv = syn_bp.read(sta)
+
+            for cmp in ('R', 'T', 'Z'):
+                try:
+                    obs_tr = obs_bp.trace(sta, cmp)
+                    syn_tr = syn_bp.trace(sta, cmp)
+
+                except:
+                    continue
+
+                # filtered bands are shared by both selectors and excluded from timing
+                filtered = bands(obs_tr, plan), bands(syn_tr, plan)
+
+                output = []
+
+                for i, selector in enumerate(('pyflex', 'native')):
+                    start = perf_counter()
+                    output.append(_window(obs_tr, syn_tr, evt, inv, cmp, selector=selector, filtered=filtered))
+                    elapsed[i] += perf_counter() - start
+
+                for iband, (a, b) in enumerate(zip(*output)):
+                    idx = _match(a, b)
+                    m = idx >= 0
+                    rows.append((sta, cmp, iband, len(a), len(b), np.count_nonzero(m)))
+                    pairs.append(np.stack([b.left[idx[m]] - a.left[m], b.right[idx[m]] - a.right[m],
+                        b.cc[idx[m]] - a.cc[m], b.tshift[idx[m]] - a.tshift[m]], axis=1))
+
+    dtype = [('station', 'U16'), ('component', 'U1'), ('band', 'i2'),
+        ('pyflex', 'i4'), ('native', 'i4'), ('matched', 'i4')]
+
+    with open(root.path(f'agreement/{event}.npz'), 'wb') as f:
+        np.savez(f, rows=np.array(rows, dtype=dtype), pairs=np.concatenate([np.zeros((0, 4))] + pairs),
+            elapsed=elapsed)
+
+
+def report(node):
+    """Summarize agreement of the two selectors and write agreement.txt."""
+    rows = []
+    pairs = []
+    elapsed = np.zeros(2)
+
+    for f in sorted(node.ls('agreement')):
+        if f.endswith('.npz'):
+            with np.load(node.path(f'agreement/{f}')) as data:
+                rows.append(data['rows'])
+                pairs.append(data['pairs'])
+                elapsed += data['elapsed']
+
+    if len(rows) == 0:
+        print('no comparisons in agreement/')
+        return
+
+    rows = np.concatenate(rows)
+    pairs = np.concatenate(pairs)
+    exact = np.count_nonzero((pairs[:, 0] == 0) & (pairs[:, 1] == 0))
+    same = np.count_nonzero(rows['pyflex'] == rows['native'])
+
+    lines = [
+        f'traces x bands:    {len(rows)} ({same} with the same number of windows)',
+        f'windows:           pyflex {rows["pyflex"].sum()}, native {rows["native"].sum()}',
+        f'matched windows:   {len(pairs)} ({exact} with identical bounds)',
+        f'time (s):          pyflex {elapsed[0]:.1f}, native {elapsed[1]:.1f}'
+    ]
+
+    if len(pairs):
+        for i, key in enumerate(('left', 'right', 'cc', 'tshift')):
+            lines.append(f'{"max |d" + key + "|:":<19}{np.abs(pairs[:, i]).max():.4g}')
+
+    node.writelines(lines, 'agreement.txt')
+    print('\n'.join(lines))
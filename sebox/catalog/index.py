@@ -21,10 +21,7 @@ def _index_events(evts):
     evt_dict = {}
 
     for event in evts:
-        lines = d.readlines(f'events/{event}')
-
-        # event time shift, half duration, latitude, longitude, depth and moment tensor
-        evt_dict[event] = np.array([float(line.split()[-1]) for line in lines[2:13]])
+        evt_dict[event] = parse_event(d.readlines(f'events/{event}'))
 
     # gather results
     evt_dict = root.mpi.comm.gather(evt_dict, root=0)
@@ -116,21 +113,18 @@ def index_stations(evts):
     for event in evts:
         eid = events.index(event)
 
-        for line in catalog.readlines(f'stations/STATIONS.{event}'):
-            if len(ll := line.split()) == 6:
-                station = ll[1] + '.' + ll[0]
-
-                if station in stations and band_data[eid][stations.index(station)] > 0:
-                    lat = float(ll[2])
-                    lon = float(ll[3])
-                    elevation = float(ll[4])
-                    burial = float(ll[5])
+        for station, ll in parse_stations(catalog.readlines(f'stations/STATIONS.{event}')):
+            if station in stations and band_data[eid][stations.index(station)] > 0:
+                lat = float(ll[2])
+                lon = float(ll[3])
+                elevation = float(ll[4])
+                burial = float(ll[5])
 
-                    # station latitude, longitude, elevation and burial depth
-                    sta_dict[station] = lat, lon, elevation, burial
+                # station latitude, longitude, elevation and burial depth
+                sta_dict[station] = lat, lon, elevation, burial
 
-                    # format line in SUPERSTATION
-                    sta_lines[station] = format_station(ll)
+                # format line in SUPERSTATION
+                sta_lines[station] = format_station(ll)
     
     # gather and save results
     sta_dict = root.mpi.comm.gather(sta_dict, root=0)
@@ -151,6 +145,16 @@ def index_stations(evts):
         catalog.write(''.join(station_lines.values()), 'SUPERSTATION')
 
 
+def parse_event(lines: tp.List[str]) -> np.ndarray:
+    """Event time shift, half duration, latitude, longitude, depth and moment tensor from lines of a CMTSOLUTION file."""
+    return np.array([float(line.split()[-1]) for line in lines[2:13]])
+
+
+def parse_stations(lines: tp.List[str]) -> tp.List[tp.Tuple[str, tp.List[str]]]:
+    """Station name (network.station) and fields of each line in STATIONS file."""
+    return [(ll[1] + '.' + ll[0], ll) for line in lines if len(ll := line.split()) == 6]
+
+
 def format_station(ll: list):
     """Format a line in STATIONS file."""
     # location of dots for floating point numbers
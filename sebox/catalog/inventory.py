@@ -0,0 +1,138 @@
+import typing as tp
+from functools import lru_cache
+
+if tp.TYPE_CHECKING:
+    from obspy import Inventory, UTCDateTime
+    from obspy.core.inventory import Station
+
+
+# directory of StationXML files shared by all events
+_store = 'inventories/stations'
+
+
+def _digest(data: bytes) -> str:
+    from hashlib import sha1
+
+    return sha1(data).hexdigest()
+
+
+def store_station(net: str, sta: 'Station') -> str:
+    """Save StationXML of a station in the shared store and return its content hash."""
+    from io import BytesIO
+    from os import replace, getpid
+    from threading import get_ident
+    from obspy import Inventory, UTCDateTime
+    from obspy.core.inventory import Network
+    from nnodes import root
+    from .ledger import append
+
+    # fixed creation time so that identical metadata has identical content
+    inv = Inventory([Network(net, [sta])], source='sebox')
+    inv.created = UTCDateTime(0)
+    buf = BytesIO()
+    inv.write(buf, format='STATIONXML')
+    data = buf.getvalue()
+    digest = _digest(data)
+
+    d = root.subdir(f'{_store}/{net}.{sta.code}')
+
+    if not d.has(f'{digest}.xml'):
+        d.mkdir()
+
+        # write to a temporary file of this thread so that readers never see a partial file
+        tmp = d.path(f'{digest}.xml.{getpid()}.{get_ident()}')
+
+        with open(tmp, 'wb') as f:
+            f.write(data)
+
+        replace(tmp, d.path(f'{digest}.xml'))
+
+        start = sta.start_date or '-'
+        end = sta.end_date or '-'
+
+        append(d.path('index.txt'), f'{digest} {start} {end}\n')
+
+    return digest
+
+
+def find_station(station: str, time: 'UTCDateTime') -> tp.Optional[str]:
+    """Content hash of stored StationXML of a station (network.station) with an epoch that contains time."""
+    from obspy import UTCDateTime
+    from nnodes import root
+
+    if not root.has(src := f'{_store}/{station}/index.txt'):
+        return None
+
+    for line in root.readlines(src):
+        if len(ll := line.split()) == 3:
+            if (ll[1] == '-' or UTCDateTime(ll[1]) <= time) and (ll[2] == '-' or time < UTCDateTime(ll[2])):
+                return ll[0]
+
+    return None
+
+
+@lru_cache(maxsize=2048)
+def load_station(station: str, digest: str) -> 'Inventory':
+    """Parsed StationXML from the shared store (shared between callers, do not modify)."""
+    from obspy import read_inventory
+    from nnodes import root
+
+    return read_inventory(root.path(f'{_store}/{station}/{digest}.xml'))
+
+
+def add_reference(event: str, station: str, digest: str):
+    """Record that an event uses StationXML of a station."""
+    from nnodes import root
+    from .ledger import append
+
+    root.mkdir('inventories')
+
+    append(root.path(f'inventories/{event}.txt'), f'{station} {digest}\n')
+
+
+def load_event(event: str) -> tp.Dict[str, 'Inventory']:
+    """Inventories of all stations of an event."""
+    from obspy import Inventory
+    from nnodes import root
+
+    if not root.has(src := f'inventories/{event}.txt'):
+        # catalog created before the shared store
+        return root.load(f'inventories/{event}.pickle')
+
+    digests = {}
+
+    for line in root.readlines(src):
+        # the same epoch may be recorded more than once by concurrent writers
+        if len(ll := line.split()) == 2 and ll[1] not in digests.setdefault(ll[0], []):
+            digests[ll[0]].append(ll[1])
+
+    invs = {}
+
+    for station, ds in digests.items():
+        if len(ds) == 1:
+            invs[station] = load_station(station, ds[0])
+
+        else:
+            # stations with more than one epoch, cached inventories are not modified
+            invs[station] = Inventory(networks=[net for d in ds for net in load_station(station, d).networks], source='sebox')
+
+    return invs
+
+
+def convert_inventories(node):
+    """Move per-event inventory pickles to the shared store."""
+    events = [e for e in node.ls('events') if node.has(f'inventories/{e}.pickle') and not node.has(f'inventories/{e}.txt')]
+    node.add_mpi(_convert_inventories, len(events), mpiarg=events)
+
+
+def _convert_inventories(event):
+    from nnodes import root
+
+    lines = ''
+
+    for station, inv in root.load(f'inventories/{event}.pickle').items():
+        for net in inv:
+            for sta in net:
+                lines += f'{station} {store_station(net.code, sta)}\n'
+
+    root.write(lines, f'inventories/{event}.txt')
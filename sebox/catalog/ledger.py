@@ -0,0 +1,101 @@
+import typing as tp
+
+
+def append(dst: str, text: str):
+    """Append lines to a file shared by threads and MPI ranks."""
+    from os import open, write, close, fsync, O_WRONLY, O_APPEND, O_CREAT
+
+    # a single write to a file opened with O_APPEND is not interleaved with other writers
+    fd = open(dst, O_WRONLY | O_APPEND | O_CREAT, 0o644)
+
+    try:
+        write(fd, text.encode())
+        fsync(fd)
+
+    finally:
+        close(fd)
+
+
+class Ledger:
+    """Append-only record of finished work units (e.g. events) of a catalog stage in ledger/{stage}.txt."""
+    # path of ledger file
+    path: str
+
+    # finished units read when the ledger is opened
+    done: tp.Set[str]
+
+    def __init__(self, stage: str):
+        from os import path
+        from nnodes import root
+
+        root.mkdir('ledger')
+        self.path = root.path(f'ledger/{stage}.txt')
+        self.done = set()
+
+        if path.exists(self.path):
+            with open(self.path, 'r') as f:
+                for line in f.readlines():
+                    # skip incomplete last line
+                    if line.endswith('\n') and len(unit := line.strip()):
+                        self.done.add(unit)
+
+    def exists(self) -> bool:
+        from os import path
+
+        return path.exists(self.path)
+
+    def mark(self, unit: str):
+        """Record a finished unit, safe to call from multiple ranks at once."""
+        append(self.path, f'{unit}\n')
+        self.done.add(unit)
+
+    def clear(self, units: tp.Iterable[str]):
+        """Remove units from the ledger so that they are processed again (not safe while ranks call mark())."""
+        from os import replace
+
+        units = set(units) & self.done
+
+        if len(units) == 0:
+            return
+
+        self.done -= units
+
+        with open(tmp := f'{self.path}.tmp', 'w') as f:
+            f.writelines(f'{unit}\n' for unit in sorted(self.done))
+
+        replace(tmp, self.path)
+
+    def remaining(self, units: tp.Iterable[str], check: tp.Optional[tp.Callable[[str], bool]] = None) -> tp.List[str]:
+        """Units not yet finished.
+
+        check: whether a unit is finished by its output files, used once to fill a ledger that does not exist yet
+            (units whose output is removed later are cleared with reset)"""
+        units = list(units)
+        self._fill(units, check)
+
+        return [unit for unit in units if unit not in self.done]
+
+    def finished(self, units: tp.Iterable[str], check: tp.Optional[tp.Callable[[str], bool]] = None) -> tp.List[str]:
+        """Units already finished (same check as remaining())."""
+        units = list(units)
+        self._fill(units, check)
+
+        return [unit for unit in units if unit in self.done]
+
+    def _fill(self, units: tp.List[str], check: tp.Optional[tp.Callable[[str], bool]]):
+        if check is None or self.exists():
+            return
+
+        for unit in units:
+            if check(unit):
+                self.mark(unit)
+
+        # create an empty ledger so that it is filled from outputs only once
+        open(self.path, 'a').close()
+
+
+def reset(node):
+    """Clear events (node.events, all events if not set) from the ledgers of stages (node.stages, e.g. ["window", "ft"])."""
+    for stage in node.stages:
+        ledger = Ledger(stage)
+        ledger.clear(node.events or list(ledger.done))
@@ -0,0 +1,130 @@
+import typing as tp
+
+if tp.TYPE_CHECKING:
+    import numpy as np
+
+
+def plot(node):
+    """Render figures of selected windows and measured bands (enabled by savefig in [window])."""
+    from sebox.catalog import catalog
+
+    if not catalog.window.get('savefig'):
+        return
+
+    node.concurrent = True
+
+    for event in node.ls('events'):
+        if node.has(f'blend_obs/{event}.npz') and node.has(f'bands/{event}.pickle'):
+            node.add(plot_event, name=event, event=event)
+
+
+def plot_event(node):
+    """Read windows and measurements of an event and render figures in a process pool."""
+    from concurrent.futures import ProcessPoolExecutor
+    from contextlib import nullcontext
+    from seisbp import SeisBP
+    from sebox.catalog import catalog
+    from .windows import load
+    from .bands import band_plan, bands
+
+    event = node.event
+    plan = band_plan()
+    wins = load(f'blend_obs/{event}.npz')
+    measurements = node.load(f'bands/{event}.pickle')
+    node.mkdir(dst := f'plots/{event}')
+
+    # optional synthetics of another model to compare with, e.g. "proc_49"
+    compare = catalog.window.get('plot_compare')
+
+    with SeisBP(f'proc_obs/{event}.bp', 'r') as obs_bp, SeisBP(f'proc_syn/{event}.bp', 'r') as syn_bp, \
+        (SeisBP(f'{compare}/{event}.bp', 'r') if compare else nullcontext()) as syn2_bp, \
+        ProcessPoolExecutor(max_workers=catalog.window.get('plot_workers')) as pool:
+        futures = []
+
+        for sta, m in measurements.items():
+            for cmp, bands_cmp in m.items():
+                try:
+                    obs = bands(obs_bp.trace(sta, cmp), plan)
+                    syn = bands(syn_bp.trace(sta, cmp), plan)
+                    syn2 = bands(syn2_bp.trace(sta, cmp), plan) if syn2_bp else None
+
+                except:
+                    continue
+
+                for iband in range(len(plan)):
+                    if bands_cmp['syn'][iband]:
+                        w = wins.get(sta, cmp, iband)
+                        futures.append(pool.submit(_render, node.path(f'{dst}/{sta}.{cmp}.{iband}.png'),
+                            obs[iband], syn[iband], None if syn2 is None else syn2[iband],
+                            w.left.copy(), w.right.copy(), iband, f'{sta}.{cmp} {1/plan[iband][2]:.0f}-{1/plan[iband][1]:.0f}s'))
+
+        for f in futures:
+            f.result()
+
+
+def _render(dst: str, obs: 'np.ndarray', syn: 'np.ndarray', syn2: tp.Optional['np.ndarray'],
+    left: 'np.ndarray', right: 'np.ndarray', iband: int, title: str):
+    """Plot filtered traces with windows, blended observed data and phase differences."""
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from scipy.fft import fft
+    from sebox.catalog import catalog
+    from .blend import gaps, blend, blend_mask
+    from .energy import Energy
+    from .window import _pad
+
+    dt = catalog.process['dt']
+    npts = len(syn)
+    t = np.arange(npts) * dt / 60
+
+    # same gap selection as threshold_blend in measurements
+    nt = int(catalog.process['period_max'] / dt / 2)
+    energy = Energy(obs, syn)
+    start, end, _ = gaps(left, right, npts, nt)
+    syn_mean = energy.query('syn', left, right + 1).sum() / npts
+    low = energy.mean('syn', start, end) / syn_mean < catalog.window['threshold_blend'] if syn_mean > 0 else \
+        np.zeros(len(start), dtype=bool)
+    mask = blend_mask(left, right, npts, nt, low)
+
+    # frequency range of the band
+    nbands = catalog.process['nbands']
+    nt_se = int(round(catalog.process['duration_encoding'] * 60 / dt))
+    df = 1 / dt / nt_se
+    imin = int(np.ceil(1 / catalog.process['period_max'] / df))
+    imax = int(np.floor(1 / catalog.process['period_min'] / df)) + 1
+    fincr = (imax - imin) // nbands
+    i1 = imin + iband * fincr
+    i2 = i1 + fincr
+
+    def phase(data, ref):
+        return np.angle(fft(_pad(np.array(data, dtype=float), nt_se))[i1: i2] / fft(_pad(np.array(ref, dtype=float), nt_se))[i1: i2])
+
+    fig, axes = plt.subplots(2, 1, figsize=(20, 15))
+    ax = axes[0]
+    ax.plot(t, obs, label='obs')
+    ax.plot(t, syn, label='syn')
+    ax.plot(t, blend(obs, syn, mask), label='obs_win')
+
+    if syn2 is not None:
+        ax.plot(t, syn2, label='syn_new')
+
+    for l, r in zip(left, right):
+        ax.axvspan(l * dt / 60, r * dt / 60, facecolor='lightgray')
+
+    ax.set_title(title)
+    ax.legend()
+
+    ax = axes[1]
+    ax.plot(phase(obs, syn), label='original')
+
+    if np.any(low):
+        ax.plot(phase(blend(obs, syn, mask), syn), label='windowed')
+
+    if syn2 is not None:
+        ax.plot(phase(obs, syn2), label='new')
+
+    ax.legend()
+    fig.savefig(dst)
+    plt.close(fig)
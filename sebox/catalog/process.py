@@ -28,38 +28,163 @@ def process(node):
 
 
 def process_observed(node):
-    events = node.ls('events')
-    node.add_mpi(_process, len(events), args=('obs',), mpiarg=events)
+    if len(events := _remaining(node, 'obs')):
+        node.add_mpi(_process, len(events), args=('obs',), mpiarg=events)
 
 
 
 def process_synthetic(node):
+    if len(events := _remaining(node, 'syn')):
+        node.add_mpi(_process, len(events), args=('syn',), mpiarg=events)
+
+
+def _remaining(node, mode):
+    """Events not yet processed according to the process ledger."""
+    from .ledger import Ledger
+
+    return Ledger(f'process_{mode}').remaining(node.ls('events'), lambda e: node.has(f'proc_{mode}/{e}.bp'))
+
+
+def validate_precision(node):
+    """Compare misfit of traces processed in float32 and float64."""
     events = node.ls('events')
-    node.add_mpi(_process, len(events), args=('syn',), mpiarg=events)
+    node.mkdir('precision')
+    node.add_mpi(_validate_precision, len(events), mpiarg=events)
+
+
+def _validate_precision(event):
+    import numpy as np
+    from nnodes import root
+    from sebox.catalog import catalog
+    from .shard import open_bp
+
+    proc = catalog.process
+    nt_se = int(round(proc['duration_encoding'] * 60 / proc['dt']))
+    df = 1 / proc['dt'] / nt_se
+    imin = int(np.ceil(1 / proc['period_max'] / df))
+    imax = int(np.floor(1 / proc['period_min'] / df)) + 1
+
+    with open_bp(f'raw_obs/{event}') as obs_bp, open_bp(f'raw_syn/{event}') as syn_bp:
+        origin = obs_bp.read(obs_bp.events[0]).preferred_origin()
+        stas = []
+        invs = []
+        raw = {'obs': [], 'syn': []}
+
+        for sta in obs_bp.channels:
+            if sta not in syn_bp.channels:
+                continue
+
+            try:
+                obs = _select(obs_bp.stream(sta))
+                syn = _select(syn_bp.stream(sta))
+                inv = obs_bp.read(sta)
+
+            except Exception:
+                continue
+
+            if obs is not None and syn is not None:
+                stas.append(sta)
+                invs.append(inv)
+                raw['obs'].append(obs)
+                raw['syn'].append(syn)
+
+    # process the same traces in both precisions
+    output = {}
+
+    for dtype in ('float64', 'float32'):
+        output[dtype] = {mode: process_streams([st.copy() for st in raw[mode]], origin, invs, mode, np.dtype(dtype))
+            for mode in ('obs', 'syn')}
+
+    lines = ['station cmp misfit64 misfit32 rel_diff trace_err']
+    diffs = []
+
+    for i, sta in enumerate(stas):
+        streams = [output[dtype][mode][i] for dtype in ('float64', 'float32') for mode in ('obs', 'syn')]
+
+        if any(st is None for st in streams):
+            continue
+
+        obs64, syn64, obs32, syn32 = streams
+
+        for cmp in ('R', 'T', 'Z'):
+            d64 = obs64.select(component=cmp)[0].data
+            d32 = obs32.select(component=cmp)[0].data
+            m64 = _misfit(d64, syn64.select(component=cmp)[0].data, nt_se, imin, imax)
+            m32 = _misfit(d32, syn32.select(component=cmp)[0].data, nt_se, imin, imax)
+
+            rel = abs(m32 - m64) / m64 if m64 > 0 else 0.0
+            err = np.linalg.norm(d32 - d64) / max(np.linalg.norm(d64), np.finfo(float).tiny)
+            diffs.append(rel)
+            lines.append(f'{sta} {cmp} {m64:.6e} {m32:.6e} {rel:.3e} {err:.3e}')
+
+    if len(diffs):
+        lines.insert(0, f'# {len(diffs)} traces, max rel_diff {max(diffs):.3e}, mean rel_diff {np.mean(diffs):.3e}')
+
+    root.writelines(lines, f'precision/{event}.log')
+
+
+def _misfit(obs, syn, nt_se, imin, imax):
+    """Spectral misfit between observed and synthetic traces within the measured frequency band."""
+    import numpy as np
+    from scipy.fft import fft
+
+    fobs = fft(np.asarray(obs, dtype=float), nt_se)[imin: imax]
+    fsyn = fft(np.asarray(syn, dtype=float), nt_se)[imin: imax]
+
+    # zero synthetics give a finite misfit instead of a division by zero
+    return float(np.sum(np.abs(fobs - fsyn) ** 2) / max(np.sum(np.abs(fsyn) ** 2), np.finfo(float).tiny))
 
 
 def _process(event, mode):
     from seisbp import SeisBP
     from sys import stderr
+    from .ledger import Ledger
+    from .shard import open_bp
 
-    with SeisBP(f'raw_{mode}/{event}.bp', 'r') as bp_r, SeisBP(f'proc_{mode}/{event}.bp', 'w') as bp_w:
+    # raw data is either a single file or shards of convert_bp_sharded that were not merged
+    with open_bp(f'raw_{mode}/{event}') as bp_r, SeisBP(f'proc_{mode}/{event}.bp', 'w') as bp_w:
         evt = bp_r.read(bp_r.events[0])
         origin = evt.preferred_origin()
         bp_w.write(evt)
+
+        stas = []
+        streams = []
+        invs = []
             
         for sta in bp_r.channels:
             try:
                 stream = bp_r.stream(sta)
                 inv = bp_r.read(sta)
-
-                if proc_stream := process_stream(stream, origin, inv, mode):
-                    bp_w.write(inv)
-                    bp_w.write(proc_stream)
-                    print(event, sta)
             
             except:
                 print(event, sta, file=stderr)
 
+            else:
+                # lists are appended together so that stations, streams and inventories stay aligned
+                stas.append(sta)
+                streams.append(stream)
+                invs.append(inv)
+
+        # select components station by station, priorities are read from catalog.toml once
+        priorities = _priorities()
+        selected = [(sta, stream, inv) for sta, stream, inv in zip(stas, (_select(st, priorities) for st in streams), invs)
+            if stream is not None]
+        stas = [s[0] for s in selected]
+        streams = [s[1] for s in selected]
+        invs = [s[2] for s in selected]
+
+        # process all stations of the event at once
+        for sta, inv, proc_stream in zip(stas, invs, process_streams(streams, origin, invs, mode)):
+            if proc_stream is None:
+                print(event, sta, file=stderr)
+                continue
+
+            bp_w.write(inv)
+            bp_w.write(proc_stream)
+            print(event, sta)
+
+    # event is finished after its output file is closed
+    Ledger(f'process_{mode}').mark(event)
 
 
 
@@ -68,20 +193,60 @@ def _process(event, mode):
     #     mpiarg=stations, group_mpiarg=True, cwd=f'log_{node.mode}', name=node.event)
 
 
-def _select(stream):
+def _priorities():
+    """Location and channel priorities from download restrictions."""
+    from sebox.catalog import catalog
+
+    try:
+        rst = catalog.download.get('restrictions') or {}
+    
+    except AttributeError:
+        rst = {}
+
+    return tuple(rst.get('location_priorities') or ()), tuple(rst.get('channel_priorities') or ())
+
+
+def _rank(loc, cha, priorities):
+    """Rank of a location and channel code by location and channel priorities (lower is better)."""
+    from fnmatch import fnmatchcase
+
+    locs, chas = priorities
+
+    return locs.index(loc) if loc in locs else len(locs), \
+        next((i for i, p in enumerate(chas) if fnmatchcase(cha, p)), len(chas))
+
+
+def _select(stream, priorities=None):
+    """Select the Z, N, E or Z, 1, 2 triplet with the highest priority."""
     from obspy import Stream
 
-    # select 3 components from the stream
-    for trace_z in stream.select(component='Z'):
-        for cmps in [['N', 'E'], ['1', '2']]:
-            traces = [trace_z]
+    priorities = priorities or _priorities()
 
-            for cmp in cmps:
-                if len(substream := stream.select(component=cmp, location=trace_z.stats.location)):
-                    traces.append(substream[0])
-            
-            if len(traces) == 3:
-                return Stream(traces)
+    # index traces by location and channel code without component
+    index = {}
+
+    for trace in stream:
+        cmps = index.setdefault((trace.stats.location, trace.stats.channel[:-1]), {})
+        cmps.setdefault(trace.stats.channel[-1], trace)
+
+    best = None
+
+    for order, ((loc, _), cmps) in enumerate(index.items()):
+        if 'Z' not in cmps:
+            continue
+
+        for h, pair in enumerate((('N', 'E'), ('1', '2'))):
+            if pair[0] in cmps and pair[1] in cmps:
+                # rank by location priority, channel priority, N/E over 1/2 and order in stream
+                rank = (*_rank(loc, cmps['Z'].stats.channel, priorities), h, order)
+
+                if best is None or rank < best[0]:
+                    best = rank, [cmps['Z'], cmps[pair[0]], cmps[pair[1]]]
+                
+                break
+    
+    if best is not None:
+        return Stream(best[1])
 
 
 def _detrend(stream, taper):
@@ -121,21 +286,74 @@ def _process_(stas, src, dst, mode):
 
 
 def process_stream(st, origin, inv, mode):
+    """Process a single station."""
+    if (stream := _select(st)) is None:
+        return
+
+    return process_streams([stream], origin, [inv], mode)[0]
+
+
+def process_streams(streams, origin, invs, mode, dtype=None):
+    """Process 3-component streams of an event (None for streams that fail)."""
     import numpy as np
     from sebox.catalog import catalog
-    from pytomo3d.signal.process import rotate_stream, sac_filter_stream
+    from .catalog import get_dtype
+    from .resample import resample_streams
+    from .rotate import rotate_streams
 
-    if (stream := _select(st)) is None:
-        return
+    proc = catalog.process
+    dt = proc['dt']
+
+    if dtype is None:
+        dtype = get_dtype()
+
+    # resample and align traces with the same sampling rate in batches
+    resampled = resample_streams(streams, dt, origin.time)
+
+    # pad to the same length for rotation
+    nt = int(np.round(proc['duration'] * 60 / dt))
+    padded = []
+
+    for stream, inv, ok in zip(streams, invs, resampled):
+        try:
+            padded.append(_process_stream(stream, inv, mode, nt, dtype) if ok else None)
+        
+        except Exception:
+            padded.append(None)
+
+    output = []
+
+    for stream in rotate_streams(padded, invs, origin):
+        # make sure stream has 1 radial, 1 transverse and 1 vertical trace
+        if stream is None or len(stream) != 3 or any(len(stream.select(component=cmp)) != 1 for cmp in ['R', 'T', 'Z']):
+            output.append(None)
+        
+        else:
+            output.append(stream)
+
+    return output
+
+
+def _astype(stream, dtype):
+    """Convert data of all traces (obspy steps may return double precision)."""
+    for trace in stream:
+        if trace.data.dtype != dtype:
+            trace.data = trace.data.astype(dtype)
+
+
+def _process_stream(stream, inv, mode, nt, dtype):
+    """Remove response of a resampled stream and pad it to nt samples, traces are kept in dtype between steps."""
+    import numpy as np
+    from sebox.catalog import catalog
+    from pytomo3d.signal.process import sac_filter_stream
 
     proc = catalog.process
     taper = proc.get('taper')
-
-    # resample and align
-    stream.interpolate(1/catalog.dt, starttime=origin.time)
         
     # detrend and apply taper after filtering
+    _astype(stream, dtype)
     _detrend(stream, taper)
+    _astype(stream, dtype)
 
     # period anchors
     cl = proc['corner_left']
@@ -144,7 +362,9 @@ def process_stream(st, origin, inv, mode):
     pmax = proc['period_max']
     pre_filt = [1/pmax*cr*cr, 1/pmax*cr, 1/pmin/cl, 1/pmin/cl/cl]
 
-    # remove instrument response
+    # remove instrument response (transformed in double precision)
+    _astype(stream, np.float64)
+
     if mode == 'obs':
         stream.attach_response(inv)
         stream.remove_response(output="DISP", zero_mean=False, taper=False,
@@ -154,20 +374,14 @@ def process_stream(st, origin, inv, mode):
         sac_filter_stream(stream, pre_filt)
 
     # detrend and apply taper
+    _astype(stream, dtype)
     _detrend(stream, taper)
+    _astype(stream, dtype)
     
-    # pad and rotate
-    nt = int(np.round(catalog.duration * 60 / catalog.dt))
-
+    # pad to the same length
     for trace in stream:
-        data = np.zeros(nt)
+        data = np.zeros(nt, dtype=dtype)
         data[:min(nt, trace.stats.npts)] = trace[:min(nt, trace.stats.npts)]
         trace.data = data
 
-    stream = rotate_stream(stream, origin.latitude, origin.longitude, inv)
-
-    # make sure stream has 1 radial, 1 transverse and 1 vertical trace
-    if len(stream) != 3 or any(len(stream.select(component=cmp)) != 1 for cmp in ['R', 'T', 'Z']):
-        return
-
     return stream
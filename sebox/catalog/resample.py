@@ -0,0 +1,100 @@
+import typing as tp
+from functools import lru_cache
+from math import floor
+
+import numpy as np
+
+if tp.TYPE_CHECKING:
+    from obspy import Stream, UTCDateTime
+
+
+# number of quantization levels of the fractional start offset in a sample
+_nfrac = 1000
+
+
+@lru_cache(maxsize=None)
+def _kernel(rate: float, dt: float, frac: float, a: int) -> tp.Optional[tp.Tuple[int, np.ndarray, np.ndarray]]:
+    """Stride, tap offsets and Lanczos weights to resample from rate to 1/dt (None if dt * rate is not an integer)."""
+    step = dt * rate
+
+    if abs(step - round(step)) > 1e-6:
+        return None
+
+    if frac == 0.0:
+        # output samples coincide with input samples
+        return int(round(step)), np.array([0]), np.array([1.0])
+
+    offsets = np.arange(-a + 1, a + 1)
+    x = frac - offsets
+    weights = np.sinc(x) * np.sinc(x / a)
+
+    return int(round(step)), offsets, weights / weights.sum()
+
+
+def resample_streams(streams: tp.List['Stream'], dt: float, starttime: 'UTCDateTime') -> tp.List[bool]:
+    """Resample streams in place to a time step of dt starting at starttime, batching traces with the same sampling rate."""
+    from sebox.catalog import catalog
+
+    a = catalog.process.get('lanczos_width') or 8
+    ok = [True] * len(streams)
+    groups: tp.Dict[tp.Tuple[float, float], list] = {}
+
+    for i, stream in enumerate(streams):
+        for tr in stream:
+            rate = tr.stats.sampling_rate
+            p0 = (starttime - tr.stats.starttime) * rate
+            nout = int(floor((tr.stats.endtime - starttime) / dt)) + 1
+
+            if p0 < 0 or nout <= 0:
+                # same as stream.interpolate, data can not be extrapolated
+                ok[i] = False
+                continue
+
+            i0 = int(floor(p0))
+            frac = round((p0 - i0) * _nfrac) / _nfrac
+
+            if frac == 1.0:
+                i0 += 1
+                frac = 0.0
+
+            if _kernel(rate, dt, frac, a) is None:
+                # fall back to obspy for sampling rates that are not a multiple of 1/dt
+                try:
+                    tr.interpolate(1/dt, starttime=starttime)
+
+                except Exception:
+                    ok[i] = False
+
+            else:
+                groups.setdefault((rate, frac), []).append((tr, i0, nout))
+
+    for (rate, frac), items in groups.items():
+        step, offsets, weights = tp.cast(tuple, _kernel(rate, dt, frac, a))
+        omin = offsets[0]
+        nmax = max(item[2] for item in items)
+        width = (nmax - 1) * step + offsets[-1] - omin + 1
+
+        # input samples needed by each trace, aligned to its first output sample
+        x = np.zeros([len(items), width])
+
+        for r, (tr, i0, _) in enumerate(items):
+            lo = i0 + omin
+            s0 = max(lo, 0)
+            s1 = min(lo + width, tr.stats.npts)
+
+            if s1 > s0:
+                x[r, s0 - lo: s1 - lo] = tr.data[s0: s1]
+
+        # apply the kernel to all traces of the group at once
+        out = np.zeros([len(items), nmax])
+
+        for o, w in zip(offsets, weights):
+            j = o - omin
+            out += w * x[:, j: j + (nmax - 1) * step + 1: step]
+
+        for r, (tr, _, nout) in enumerate(items):
+            tr.data = out[r, :nout].copy()
+            tr.stats.delta = dt
+            tr.stats.starttime = starttime
+
+    return ok
@@ -0,0 +1,133 @@
+import typing as tp
+from functools import lru_cache
+
+import numpy as np
+
+if tp.TYPE_CHECKING:
+    from obspy import Stream, Inventory
+    from obspy.core.event import Origin
+
+
+# horizontal component pairs accepted by _select
+_horizontals = (('N', 'E'), ('1', '2'))
+
+# nominal (azimuth, dip) of Z, N and E channels
+_nominal = ((0.0, -90.0), (0.0, 0.0), (90.0, 0.0))
+
+
+def back_azimuths(origin: 'Origin', lats: tp.Sequence[float], lons: tp.Sequence[float]) -> np.ndarray:
+    """Back azimuths in degrees from a list of stations to an event."""
+    from obspy.geodetics import gps2dist_azimuth
+
+    return np.array([gps2dist_azimuth(origin.latitude, origin.longitude, lat, lon)[2]
+        for lat, lon in zip(lats, lons)])
+
+
+@lru_cache(maxsize=None)
+def _zne_matrix(orientations: tp.Tuple[tp.Tuple[float, float], ...]) -> np.ndarray:
+    """Matrix that maps 3 channels with given (azimuth, dip) to Z, N and E."""
+    az = np.radians([o[0] for o in orientations])
+    dip = np.radians([o[1] for o in orientations])
+
+    # unit vector of each channel in (Z, N, E) with dip measured downward
+    a = np.stack([-np.sin(dip), np.cos(dip) * np.cos(az), np.cos(dip) * np.sin(az)], axis=1)
+
+    return np.linalg.inv(a)
+
+
+def _rt_matrices(baz: np.ndarray) -> np.ndarray:
+    """Matrices that map (Z, N, E) to (Z, R, T) for an array of back azimuths."""
+    ba = np.radians(baz)
+    m = np.zeros([len(ba), 3, 3])
+    m[:, 0, 0] = 1.0
+    m[:, 1, 1] = -np.cos(ba)
+    m[:, 1, 2] = -np.sin(ba)
+    m[:, 2, 1] = np.sin(ba)
+    m[:, 2, 2] = -np.cos(ba)
+
+    return m
+
+
+def _orient(stream: 'Stream', inv: 'Inventory'):
+    """Sort a 3-component stream into (Z, H1, H2) and get channel orientations and station location."""
+    trace_z = stream.select(component='Z')[0]
+
+    for cmps in _horizontals:
+        if all(len(stream.select(component=cmp)) == 1 for cmp in cmps):
+            traces = [trace_z] + [stream.select(component=cmp)[0] for cmp in cmps]
+            break
+
+    else:
+        raise ValueError(f'no horizontal components in {trace_z.id}')
+
+    if cmps[0] == 'N':
+        orientations = _nominal
+
+    else:
+        # use channel azimuth and dip from inventory for 1/2 channels
+        orientations = []
+
+        for tr in traces:
+            o = inv.get_orientation(tr.id, tr.stats.starttime)
+            orientations.append((round(o['azimuth'], 4), round(o['dip'], 4)))
+
+    # station location does not depend on channel codes (synthetics are MX? with inventory of observed data)
+    sta = inv.select(network=trace_z.stats.network, station=trace_z.stats.station)[0][0]
+
+    return traces, tuple(orientations), sta.latitude, sta.longitude
+
+
+def rotate_streams(streams: tp.List[tp.Optional['Stream']], invs: tp.List['Inventory'], origin: 'Origin',
+    baz: tp.Optional[np.ndarray] = None) -> tp.List[tp.Optional['Stream']]:
+    """Rotate padded 3-component streams of an event to Z, R and T (None if a stream can not be rotated)."""
+    from obspy import Stream
+
+    output: tp.List[tp.Optional[Stream]] = [None] * len(streams)
+    idx = []
+    traces = []
+    mats = []
+    lats = []
+    lons = []
+
+    for i, (stream, inv) in enumerate(zip(streams, invs)):
+        if stream is None:
+            continue
+
+        try:
+            trs, orientations, lat, lon = _orient(stream, inv)
+
+        except Exception:
+            continue
+
+        idx.append(i)
+        traces.append(trs)
+        mats.append(_zne_matrix(orientations))
+        lats.append(lat)
+        lons.append(lon)
+
+    if len(idx) == 0:
+        return output
+
+    if baz is None:
+        baz = back_azimuths(origin, lats, lons)
+
+    else:
+        baz = np.asarray(baz)[idx]
+
+    # rotate all stations with one batched matrix product
+    data = np.stack([[tr.data for tr in trs] for trs in traces])
+    m = np.einsum('sij,sjk->sik', _rt_matrices(baz), np.stack(mats)).astype(data.dtype)
+    rotated = np.einsum('sij,sjt->sit', m, data)
+
+    for k, (i, trs) in enumerate(zip(idx, traces)):
+        stream = Stream()
+
+        for j, cmp in enumerate(('Z', 'R', 'T')):
+            tr = trs[j]
+            tr.data = rotated[k, j].astype(tr.data.dtype)
+            tr.stats.channel = tr.stats.channel[:-1] + cmp
+            stream.append(tr)
+
+        output[i] = stream
+
+    return output
@@ -0,0 +1,109 @@
+import typing as tp
+
+import numpy as np
+
+
+# fields of a band rejected before window selection
+dtype = np.dtype([
+    # station name (network.station)
+    ('station', 'U16'),
+
+    # component (R, T or Z)
+    ('component', 'U1'),
+
+    # index of frequency band
+    ('band', 'i2'),
+
+    # signal to noise ratio of mean energy (compared with snr_integrate_base)
+    ('snr_int', 'f4'),
+
+    # signal to noise ratio of maximum amplitude (compared with snr_max_base)
+    ('snr_amp', 'f4')
+])
+
+
+def data_quality(obs: np.ndarray, noise: tp.Sequence[tp.Tuple[int, int]],
+    signal: tp.Sequence[tp.Tuple[int, int]]) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Signal to noise ratios of energy and amplitude of traces [ntraces, npts] (same as pyflex check_data_quality).
+
+    noise and signal are python slices (start, end) of each trace, returns ratios and whether both slices are not empty."""
+    obs = np.atleast_2d(obs)
+    npts = obs.shape[-1]
+    i = np.arange(npts)
+
+    # slice bounds with python semantics (negative indices count from the end)
+    nb = np.array([slice(*s).indices(npts)[:2] for s in noise]).reshape(-1, 2)
+    sb = np.array([slice(*s).indices(npts)[:2] for s in signal]).reshape(-1, 2)
+    in_noise = (i >= nb[:, :1]) & (i < nb[:, 1:])
+    in_signal = (i >= sb[:, :1]) & (i < sb[:, 1:])
+
+    energy = obs ** 2
+    amp = np.abs(obs)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        snr_int = (np.sum(energy * in_signal, axis=-1) / np.count_nonzero(in_signal, axis=-1)) / \
+            (np.sum(energy * in_noise, axis=-1) / np.count_nonzero(in_noise, axis=-1))
+        snr_amp = np.max(amp * in_signal, axis=-1) / np.max(amp * in_noise, axis=-1)
+
+    return snr_int, snr_amp, in_noise.any(axis=-1) & in_signal.any(axis=-1)
+
+
+def screen(obs: np.ndarray, params: tp.Sequence[dict], first: float) -> tp.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Whether bands [nbands, npts] of a trace can pass the global data quality check of pyflex.
+
+    params: keyword arguments of pyflex.Config of each band
+    first: first arrival time after origin in seconds"""
+    from .flexwin import defaults
+
+    cfgs = [{**defaults, **p} for p in params]
+    noise = []
+    signal = []
+
+    for cfg in cfgs:
+        # pyflex uses the arrival time in seconds as sample index
+        end = cfg['noise_end_index']
+        end = int(first - cfg['min_period']) if end is None else end
+        start = cfg['signal_start_index']
+        noise.append((cfg['noise_start_index'], end))
+        signal.append((end if start is None else start, cfg['signal_end_index']))
+
+    snr_int, snr_amp, valid = data_quality(obs, noise, signal)
+    check = np.array([bool(cfg['check_global_data_quality']) for cfg in cfgs])
+    base_int = np.array([cfg['snr_integrate_base'] for cfg in cfgs])
+    base_amp = np.array([cfg['snr_max_base'] for cfg in cfgs])
+
+    # NaN ratios pass as in pyflex, empty noise or signal fails selection
+    passed = ~check | (valid & ~(snr_int < base_int) & ~(snr_amp < base_amp))
+
+    return passed, snr_int, snr_amp
+
+
+def write(dst: str, rank: int, rows: tp.List[tuple]):
+    """Append rejected bands of a station to the log of a rank."""
+    from nnodes import root
+
+    if len(rows) == 0:
+        return
+
+    root.mkdir(dst)
+
+    with open(root.path(f'{dst}/{rank:04d}.txt'), 'a') as f:
+        f.writelines(f'{sta} {cmp} {band} {si:.6g} {sa:.6g}\n' for sta, cmp, band, si, sa in rows)
+
+
+def collect(src: str) -> np.ndarray:
+    """Rejected bands logged by all ranks in directory src."""
+    from nnodes import root
+
+    rows = set()
+
+    if root.has(src):
+        for f in root.ls(src):
+            if f.endswith('.txt'):
+                with open(root.path(f'{src}/{f}'), 'r') as fp:
+                    for line in fp.readlines():
+                        # skip incomplete last line, stations retried after a crash are logged twice
+                        if line.endswith('\n') and len(ll := line.split()) == 5:
+                            rows.add((ll[0], ll[1], int(ll[2]), float(ll[3]), float(ll[4])))
+
+    return np.array(sorted(rows), dtype=dtype)
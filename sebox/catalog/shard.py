@@ -0,0 +1,101 @@
+import typing as tp
+
+
+class ShardedBP:
+    """Read-only view of BP shards in a directory as a single file."""
+    # directory of shards
+    src: str
+
+    # names of all shards
+    names: tp.List[str]
+
+    # shard name of each station
+    index: tp.Dict[str, str]
+
+    # opened shards
+    shards: tp.Dict[str, tp.Any]
+
+    def __init__(self, src: str):
+        from nnodes import root
+
+        self.src = src
+        self.names = sorted(f[:-4] for f in root.ls(src) if f.endswith('.txt'))
+        self.index = {}
+        self.shards = {}
+
+        # stations of each shard are listed in an index file next to it
+        for shard in self.names:
+            for line in root.readlines(f'{src}/{shard}.txt'):
+                if sta := line.strip():
+                    self.index[sta] = shard
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        for bp in self.shards.values():
+            bp.__exit__(*args)
+
+        self.shards.clear()
+
+    def _open(self, shard: str):
+        from seisbp import SeisBP
+
+        if shard not in self.shards:
+            self.shards[shard] = SeisBP(f'{self.src}/{shard}.bp', 'r').__enter__()
+
+        return self.shards[shard]
+
+    @property
+    def events(self) -> tp.List[str]:
+        """Event is stored in the first shard."""
+        return self._open(self.names[0]).events
+
+    @property
+    def stations(self) -> tp.List[str]:
+        return list(self.index)
+
+    @property
+    def channels(self) -> tp.List[str]:
+        """Stations with waveforms (only stations with a stream are listed in shard index files)."""
+        return list(self.index)
+
+    def read(self, name: str):
+        if name in self.index:
+            return self._open(self.index[name]).read(name)
+
+        for shard in self.names:
+            if name in (bp := self._open(shard)).events:
+                return bp.read(name)
+
+        raise KeyError(name)
+
+    def stream(self, sta: str):
+        return self._open(self.index[sta]).stream(sta)
+
+    def trace(self, sta: str, cmp: str):
+        return self._open(self.index[sta]).trace(sta, cmp)
+
+
+def open_bp(src: str):
+    """Read-only BP file {src}.bp, or a view of the shards in directory src if they are not merged."""
+    from nnodes import root
+    from seisbp import SeisBP
+
+    if not root.has(f'{src}.bp') and root.has(src):
+        return ShardedBP(src)
+
+    return SeisBP(f'{src}.bp', 'r')
+
+
+def merge(src: str, dst: str):
+    """Concatenate BP shards in directory src into file dst."""
+    from seisbp import SeisBP
+
+    with ShardedBP(src) as bp_r, SeisBP(dst, 'w') as bp_w:
+        for event in bp_r.events:
+            bp_w.write(bp_r.read(event))
+
+        for sta in bp_r.stations:
+            bp_w.write(bp_r.read(sta))
+            bp_w.write(bp_r.stream(sta))
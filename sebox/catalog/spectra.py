@@ -0,0 +1,99 @@
+import typing as tp
+
+import numpy as np
+
+
+# kinds of spectra of each trace (observed, synthetic and observed blended with synthetic)
+kinds = ('obs', 'syn', 'win')
+
+# components in the second dimension of spectra
+components = ('R', 'T', 'Z')
+
+
+class SpectraWriter:
+    """Spectra of an event accumulated as [stations, components, frequencies] arrays and written to one HDF5 file."""
+    # number of frequencies
+    nf: int
+
+    # spectra [components, frequencies] of each kind of measured stations
+    data: tp.Dict[str, tp.List[np.ndarray]]
+
+    # whether a measured station has a component
+    mask: tp.List[np.ndarray]
+
+    # station names in the order of the first dimension
+    stations: tp.List[str]
+
+    def __init__(self, nf: int):
+        # only rows of measured stations are kept and stacked when written
+        self.nf = nf
+        self.data = {kind: [] for kind in kinds}
+        self.mask = []
+        self.stations = []
+
+    def add(self, station: str, spectra: tp.Dict[str, tp.Dict[str, np.ndarray]]):
+        """Add spectra of a station, spectra[cmp][kind] for available components."""
+        self.stations.append(station)
+        self.mask.append(np.array([cmp in spectra for cmp in components]))
+
+        for kind in kinds:
+            row = np.zeros((len(components), self.nf), dtype=complex)
+
+            for j, cmp in enumerate(components):
+                if cmp in spectra:
+                    row[j] = spectra[cmp][kind]
+
+            self.data[kind].append(row)
+
+    def write(self, dst: str, attrs: tp.Optional[dict] = None):
+        """Write one contiguous dataset per kind, the mask and the station index."""
+        import h5py
+        from nnodes import root
+
+        with h5py.File(root.path(dst), 'w') as f:
+            for kind in kinds:
+                f.create_dataset(kind, data=np.array(self.data[kind], dtype=complex).reshape(-1, len(components), self.nf))
+
+            f.create_dataset('mask', data=np.array(self.mask, dtype=bool).reshape(-1, len(components)))
+            f.create_dataset('stations', data=np.array(self.stations, dtype='S'))
+            f.attrs['components'] = ''.join(components)
+
+            for key, val in (attrs or {}).items():
+                f.attrs[key] = val
+
+
+def stations(src: str) -> tp.List[str]:
+    """Stations in a spectra file."""
+    import h5py
+    from nnodes import root
+
+    with h5py.File(root.path(src), 'r') as f:
+        return [sta.decode() for sta in f['stations'][:]]
+
+
+def read(src: str, kind: str, station: tp.Optional[str] = None) -> tp.Tuple[np.ndarray, np.ndarray]:
+    """Spectra [stations, components, frequencies] and mask of a kind, or [components, frequencies] of one station."""
+    import h5py
+    from nnodes import root
+
+    with h5py.File(root.path(src), 'r') as f:
+        if station is None:
+            return f[kind][:], f['mask'][:]
+
+        # only the row of the station is read from disk
+        idx = np.nonzero(f['stations'][:] == station.encode())[0]
+
+        if len(idx) == 0:
+            raise KeyError(f'{station} not in {src}')
+
+        return f[kind][idx[0]], f['mask'][idx[0]]
+
+
+def read_trace(src: str, kind: str, station: str, cmp: str) -> np.ndarray:
+    """Spectrum of one trace as in the former ft_{kind}/{event}.h5 files (auxiliary data FT/{net}_{sta}_MX{cmp}).
+
+    Missing components are filled with NaN like the former files."""
+    data, mask = read(src, kind, station)
+    j = components.index(cmp)
+
+    return data[j] if mask[j] else np.full(data.shape[-1], np.nan + 0j, dtype=complex)
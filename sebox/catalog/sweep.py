@@ -0,0 +1,144 @@
+import typing as tp
+
+if tp.TYPE_CHECKING:
+    import numpy as np
+
+
+# thresholds in [window] that can be swept
+thresholds = ('threshold_obs', 'threshold_syn', 'threshold_diff', 'threshold_duration', 'threshold_blend')
+
+
+def sweep(node):
+    """Count traces and bands accepted by each combination of thresholds in [window.sweep]."""
+    node.mkdir('sweep')
+    events = [e for e in node.ls('events') if node.has(f'blend_obs/{e}.npz') and not node.has(f'sweep/{e}.npz')]
+
+    if len(events):
+        node.add_mpi(_collect, len(events), mpiarg=events)
+
+    node.add(evaluate)
+
+
+def _gaps(energy, iband: int, left: 'np.ndarray', right: 'np.ndarray', nt: int) -> 'np.ndarray':
+    """Mean syn energy of the gaps between windows relative to mean energy of windows (compared with threshold_blend)."""
+    import numpy as np
+    from .blend import gaps
+
+    npts = energy.npts
+    l, r, _ = gaps(left, right, npts, nt)
+
+    syn_mean = energy.query('syn', left, right + 1, iband).sum() / npts
+
+    if syn_mean == 0:
+        return np.zeros(0)
+
+    return energy.mean('syn', l, r, iband) / syn_mean
+
+
+def _collect(event):
+    """Compute energy ratios of all windowed traces and bands of an event."""
+    import numpy as np
+    from seisbp import SeisBP
+    from nnodes import root
+    from sebox.catalog import catalog
+    from .windows import load
+    from .bands import band_plan, bands
+    from .energy import Energy
+
+    plan = band_plan()
+    nt = int(catalog.process['period_max'] / catalog.process['dt'] / 2)
+    wins = load(f'blend_obs/{event}.npz')
+
+    rows = []
+    gaps = [np.zeros(0)]
+    gap_rows = [np.zeros(0, dtype=int)]
+
+    with SeisBP(f'proc_obs/{event}.bp', 'r') as obs_bp, SeisBP(f'proc_syn/{event}.bp', 'r') as syn_bp:
+        for sta in wins.stations:
+            for cmp in ('R', 'T', 'Z'):
+                if len(wins_cmp := wins.get(sta, cmp)) == 0:
+                    continue
+
+                try:
+                    obs_tr = obs_bp.trace(sta, cmp)
+                    syn_tr = syn_bp.trace(sta, cmp)
+
+                except:
+                    continue
+
+                # all bands of a trace are stacked in one energy engine
+                energy = Energy(bands(obs_tr, plan), bands(syn_tr, plan))
+                npts = energy.npts
+
+                for iband in range(len(plan)):
+                    if len(w := wins_cmp[wins_cmp.band == iband]) == 0:
+                        continue
+
+                    ratio_obs, ratio_syn, ratio_diff = energy.ratios(w.left, w.right, np.full(len(w), iband))
+                    duration = np.sum(w.right - w.left + 1) / npts
+                    rb = _gaps(energy, iband, w.left.astype(int), w.right.astype(int), nt)
+
+                    gaps.append(rb)
+                    gap_rows.append(np.full(len(rb), len(rows)))
+                    rows.append((sta, cmp, iband, duration, ratio_obs[iband], ratio_syn[iband], ratio_diff[iband]))
+
+    dtype = [('station', 'U16'), ('component', 'U1'), ('band', 'i2'),
+        ('duration', 'f8'), ('obs', 'f8'), ('syn', 'f8'), ('diff', 'f8')]
+
+    with open(root.path(f'sweep/{event}.npz'), 'wb') as f:
+        np.savez(f, rows=np.array(rows, dtype=dtype), gaps=np.concatenate(gaps), gap_rows=np.concatenate(gap_rows))
+
+
+def _grid() -> tp.List[tp.Dict[str, float]]:
+    from itertools import product
+    from sebox.catalog import catalog
+
+    cfg = catalog.window.get('sweep', {})
+    values = [cfg.get(key, [catalog.window[key]]) for key in thresholds]
+
+    return [dict(zip(thresholds, v)) for v in product(*values)]
+
+
+def evaluate(node):
+    """Evaluate all threshold combinations on cached energy ratios and write sweep.txt."""
+    import numpy as np
+
+    rows = []
+    traces = []
+    gaps = []
+    gap_rows = []
+    nrows = 0
+
+    for f in sorted(node.ls('sweep')):
+        if f.endswith('.npz'):
+            with np.load(node.path(f'sweep/{f}')) as data:
+                rows.append(data['rows'])
+                traces.append(np.char.add(f'{f[:-4]}.', np.char.add(data['rows']['station'], data['rows']['component'])))
+                gaps.append(data['gaps'])
+                gap_rows.append(data['gap_rows'] + nrows)
+                nrows += len(data['rows'])
+
+    if nrows == 0:
+        print('no cached ratios in sweep/')
+        return
+
+    rows = np.concatenate(rows)
+    gaps = np.concatenate(gaps)
+    gap_rows = np.concatenate(gap_rows)
+
+    # index of event, station and component of each row
+    trace = np.unique(np.concatenate(traces), return_inverse=True)[1]
+
+    lines = [' '.join(f'{key[10:]:>9}' for key in thresholds) + f'{"traces":>9}{"bands":>9}{"blended":>9}{"gaps":>9}']
+
+    for th in _grid():
+        has_duration = rows['duration'] >= th['threshold_duration']
+        has_full = has_duration & (rows['diff'] > th['threshold_diff'])
+        has_blended = has_full & (rows['obs'] > th['threshold_obs']) & (rows['syn'] > th['threshold_syn'])
+        ngaps = np.count_nonzero(has_full[gap_rows] & (gaps < th['threshold_blend']))
+
+        lines.append(' '.join(f'{th[key]:9.4g}' for key in thresholds) +
+            f'{len(np.unique(trace[has_full])):9d}{np.count_nonzero(has_full):9d}{np.count_nonzero(has_blended):9d}{ngaps:9d}')
+
+    node.writelines(lines, 'sweep.txt')
+    print('\n'.join(lines))
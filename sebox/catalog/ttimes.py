@@ -0,0 +1,142 @@
+import typing as tp
+from functools import lru_cache
+
+import numpy as np
+
+
+# maximum distance of the table in degrees
+_distance_max = 180.0
+
+
+def _grid() -> tp.Tuple[np.ndarray, np.ndarray]:
+    """Source depths (km) and epicentral distances (degree) of the table."""
+    from sebox.catalog import catalog
+
+    cfg = catalog.window.get('ttimes', {})
+    depths = np.arange(0, cfg.get('depth_max', 700.0) + 1e-6, cfg.get('depth_step', 10.0))
+    distances = np.arange(0, _distance_max + 1e-6, cfg.get('distance_step', 0.5))
+
+    return depths, distances
+
+
+@lru_cache(maxsize=4)
+def _taup(model: str):
+    """TauP model shared by all window selectors of a process."""
+    from obspy.taup import TauPyModel
+
+    return TauPyModel(model=model)
+
+
+@lru_cache(maxsize=1)
+def _table() -> tp.Optional[np.ndarray]:
+    """Travel time table in catalog directory, looked up once per process (None if not built)."""
+    from .catalog import d
+
+    return d.load('ttimes.npy') if d.has('ttimes.npy') else None
+
+
+@lru_cache(maxsize=1)
+def table_digest() -> str:
+    """Hash of the travel time table and its grid ("" if not built), part of the keys of cached windows."""
+    from hashlib import sha1
+
+    if (table := _table()) is None:
+        return ''
+
+    h = sha1(np.ascontiguousarray(table).view(np.uint8))
+
+    for axis in _grid():
+        h.update(np.ascontiguousarray(axis).view(np.uint8))
+
+    return h.hexdigest()
+
+
+def build_ttimes(node):
+    """Compute first and last arrival times on a (depth, distance) grid and save as ttimes.npy."""
+    depths, _ = _grid()
+    node.mkdir('ttimes')
+    node.add_mpi(_build_ttimes, min(node.np, len(depths)), mpiarg=list(range(len(depths))), group_mpiarg=True)
+    node.add(_merge_ttimes)
+
+
+def _build_ttimes(idepths):
+    from nnodes import root
+    from sebox.catalog import catalog
+
+    depths, distances = _grid()
+    model = _taup(catalog.window['flexwin']['default']['earth_model'])
+
+    for i in idepths:
+        row = np.full((2, len(distances)), np.nan)
+
+        for j, dist in enumerate(distances):
+            if len(tts := model.get_travel_times(source_depth_in_km=depths[i], distance_in_degree=dist)):
+                row[0, j] = tts[0].time
+                row[1, j] = tts[-1].time
+
+        root.dump(row, f'ttimes/{i:04d}.npy')
+
+
+def _merge_ttimes(node):
+    depths, _ = _grid()
+    table = np.stack([node.load(f'ttimes/{i:04d}.npy') for i in range(len(depths))], axis=1)
+    node.dump(table, 'ttimes.npy')
+    node.rm('ttimes')
+
+
+def arrival_times(depth: float, distance: float) -> tp.Optional[tp.Tuple[float, float]]:
+    """First and last arrival times in seconds by bilinear interpolation of ttimes.npy (None if not available)."""
+    if (table := _table()) is None:
+        return None
+
+    depths, distances = _grid()
+
+    if table.shape[1:] != (len(depths), len(distances)) or not (0 <= depth <= depths[-1]):
+        return None
+
+    i = min(int(depth // (depths[1] - depths[0])), len(depths) - 2)
+    j = min(int(distance // (distances[1] - distances[0])), len(distances) - 2)
+    u = (depth - depths[i]) / (depths[1] - depths[0])
+    v = (distance - distances[j]) / (distances[1] - distances[0])
+
+    t = table[:, i, j] * (1 - u) * (1 - v) + table[:, i + 1, j] * u * (1 - v) + \
+        table[:, i, j + 1] * (1 - u) * v + table[:, i + 1, j + 1] * u * v
+
+    if np.any(np.isnan(t)):
+        return None
+
+    return float(t[0]), float(t[1])
+
+
+def table_selector(observed, synthetic, config, event=None, station=None):
+    """pyflex window selector with arrival times from ttimes.npy instead of per-trace TauP calls."""
+    return _selector()(observed, synthetic, config, event, station)
+
+
+@lru_cache(maxsize=1)
+def _selector():
+    from pyflex import WindowSelector
+    from pyflex import window_selector
+
+    # WindowSelector.__init__ loads a TauP model for every selector, share one model per process instead
+    window_selector.TauPyModel = _taup
+
+    class TableSelector(WindowSelector):
+        def calculate_ttimes(self):
+            from obspy.geodetics import locations2degrees
+            from sebox.catalog import catalog
+
+            dist = locations2degrees(self.station.latitude, self.station.longitude,
+                self.event.latitude, self.event.longitude)
+
+            # table is computed with the default earth model
+            default = catalog.window['flexwin']['default'].get('earth_model')
+
+            if self.config.earth_model == default and (tt := arrival_times(self.event.depth_in_m / 1000, dist)):
+                # only the first arrival is used by window selection
+                self.ttimes = [{'time': tt[0], 'name': 'first'}, {'time': tt[1], 'name': 'last'}]
+
+            else:
+                super().calculate_ttimes()
+
+    return TableSelector
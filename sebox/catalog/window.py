@@ -138,94 +138,49 @@ def _blend2(event) -> tp.Any:
 
 
 def window(node):
-    node.concurrent = True
-    node.mkdir('blend_obs')
-
-    for event in node.ls('events'):
-        # if node.has(f'proc_obs/{event}.bp') and node.has(f'proc_syn/{event}.bp') and not node.has(f'blend_obs/{event}.bp'):
-        if node.has(f'proc_obs/{event}.bp') and node.has(f'proc_syn/{event}.bp'):
-            node.add(window_event, name=event, event=event)
-
-
-def window3(node):
-    from seisbp import SeisBP
+    from .ledger import Ledger
 
     node.concurrent = True
+    node.mkdir('blend_obs')
 
-    for e in node.ls('blend_obs'):
-        if node.has(f'done/{e}'):
-            continue
-
-        with SeisBP(f'proc_syn/{e}.bp', 'r') as bp:
-            ratio = len(node.ls(f'blend_obs/{e}')) / len(bp.stations)
-
-            if ratio != 1:
-                node.add(window_event, name=e, event=e)
-            
-            else:
-                node.write(str(len(bp.stations)), f'done/{e}')
-
-
-def ft(node):
     events = node.ls('events')
-    node.add_mpi(_ft, len(events), mpiarg=events)
+    ready = set(_processed('obs', node, events)) & set(_processed('syn', node, events))
 
+    for event in Ledger('window').remaining(events, lambda e: node.has(f'blend_obs/{e}.npz')):
+        if event in ready:
+            node.add(window_event, name=event, event=event)
 
-def ft2(node):
-    for event in node.ls('events'):
-        node.add_mpi(_ft2, node.np, args=(event,), mpiarg=node.ls(f'blend_obs/{event}'), group_mpiarg=True)
 
+# incomplete events are resumed by window through the window ledger
+window3 = window
 
-def _ft2(stas, event):
-    from seisbp import SeisBP
-    from nnodes import root
-    from sebox.catalog import catalog
-    import numpy as np
 
-    nbands = catalog.process['nbands']
-
-    nt_se = int(round((catalog.process['duration_encoding']) * 60 / catalog.process['dt']))
-    df = 1 / catalog.process['dt'] / nt_se
+def _processed(mode, node, events):
+    """Events with processed traces according to the process ledger."""
+    from .ledger import Ledger
 
-    imin = int(np.ceil(1 / catalog.process['period_max'] / df))
-    imax = int(np.floor(1 / catalog.process['period_min'] / df)) + 1
-    fincr = (imax - imin) // nbands
+    return Ledger(f'process_{mode}').finished(events, lambda e: node.has(f'proc_{mode}/{e}.bp'))
 
-    measurements = {}
 
-    with SeisBP(f'proc_obs/{event}.bp', 'r') as obs_bp, SeisBP(f'proc_syn/{event}.bp', 'r') as syn_bp, \
-        SeisBP(f'proc_49/{event}.bp', 'r') as syn2_bp:
-        for stap in stas:
-            sta = '.'.join(stap.split('.')[:2])
-            
-            try:
-                wins_rtz = root.load(f'blend_obs/{event}/{sta}.pickle')
-            
-            except:
-                # print(event, sta)
-                continue
+def ft(node):
+    from .ledger import Ledger
 
-            if not any(len(wins) for wins in wins_rtz):
-                continue
+    # events with windows and without measurements
+    events = Ledger('window').finished(node.ls('events'), lambda e: node.has(f'blend_obs/{e}.npz'))
+    events = Ledger('ft').remaining(events, lambda e: node.has(f'bands/{e}.pickle'))
 
-            for cmp in ('R', 'T', 'Z'):
-                try:
-                    obs_tr = obs_bp.trace(sta, cmp)
-                    syn_tr = syn_bp.trace(sta, cmp)
-                    syn2_tr = syn2_bp.trace(sta, cmp)
-                
-                except:
-                    pass
-                
-                else:
-                    _ft_trace(obs_tr, syn_tr, syn2_tr, wins_rtz[cmp], sta, cmp)
+    if len(events):
+        node.mkdir('ft')
+        node.add_mpi(_ft, len(events), mpiarg=events)
 
 
 def _ft(event):
-    from pyasdf import ASDFDataSet
     from seisbp import SeisBP
     from nnodes import root
     from sebox.catalog import catalog
+    from .windows import load
+    from .ledger import Ledger
+    from .spectra import SpectraWriter
     import numpy as np
 
     nbands = catalog.process['nbands']
@@ -239,22 +194,13 @@ def _ft(event):
     nf = fincr * nbands
 
     measurements = {}
+    wins = load(f'blend_obs/{event}.npz')
 
-    with SeisBP(f'proc_obs/{event}.bp', 'r') as obs_bp, SeisBP(f'proc_syn/{event}.bp', 'r') as syn_bp, \
-        ASDFDataSet(f'ft_obs/{event}.h5', mode='w', mpi=False) as obs_h5, ASDFDataSet(f'ft_syn/{event}.h5', mode='w', mpi=False) as syn_h5, \
-        ASDFDataSet(f'ft_win/{event}.h5', mode='w', mpi=False) as win_h5:
-        for sta in syn_bp.stations:
-            if not root.has(pkl := f'blend_obs/{event}/{sta}.pickle'):
-                continue
-            
-            try:
-                wins_rtz = root.load(pkl)
-            
-            except:
-                # print(event, sta)
-                continue
+    with SeisBP(f'proc_obs/{event}.bp', 'r') as obs_bp, SeisBP(f'proc_syn/{event}.bp', 'r') as syn_bp:
+        writer = SpectraWriter(nf)
 
-            if not any(len(wins) for wins in wins_rtz):
+        for sta in syn_bp.stations:
+            if len(wins.get(sta)) == 0:
                 continue
             
             output = {}
@@ -268,7 +214,7 @@ def _ft(event):
                     pass
                 
                 else:
-                    m = _ft_trace(obs_tr, syn_tr, wins_rtz[cmp], sta, cmp)
+                    m = _ft_trace(obs_tr, syn_tr, [wins.get(sta, cmp, b) for b in range(nbands)], sta, cmp)
                     # try:
                     #     m = _ft_trace(obs_tr, syn_tr, wins_rtz[cmp], cmp)
                     
@@ -282,28 +228,20 @@ def _ft(event):
             if len(output):
                 measurements[sta] = {}
 
-                for cmp in ('R', 'T', 'Z'):
-                    if cmp in output:
-                        measurements[sta][cmp] = {}
-                        ft_obs = output[cmp]['obs']
-                        ft_syn = output[cmp]['syn']
-                        ft_win = output[cmp]['win']
-
-                        measurements[sta][cmp]['obs'] = output[cmp]['obs_bands']
-                        measurements[sta][cmp]['syn'] = output[cmp]['syn_bands']
-                        measurements[sta][cmp]['win'] = output[cmp]['win_bands']
-                    
-                    else:
-                        ft_obs = np.full(nf, np.nan + 0j, dtype=complex)
-                        ft_syn = np.full(nf, np.nan + 0j, dtype=complex)
-                        ft_win = np.full(nf, np.nan + 0j, dtype=complex)
-                    
-                    obs_h5.add_auxiliary_data(ft_obs, 'FT', sta.replace('.', '_') + '_MX' + cmp, {}) # type: ignore
-                    syn_h5.add_auxiliary_data(ft_syn, 'FT', sta.replace('.', '_') + '_MX' + cmp, {}) # type: ignore
-                    win_h5.add_auxiliary_data(ft_win, 'FT', sta.replace('.', '_') + '_MX' + cmp, {}) # type: ignores
+                for cmp in output:
+                    measurements[sta][cmp] = {}
+                    measurements[sta][cmp]['obs'] = output[cmp]['obs_bands']
+                    measurements[sta][cmp]['syn'] = output[cmp]['syn_bands']
+                    measurements[sta][cmp]['win'] = output[cmp]['win_bands']
+
+                # missing components are marked in the mask instead of filled with NaN
+                writer.add(sta, output)
         
+        writer.write(f'ft/{event}.h5', {'imin': imin, 'fincr': fincr, 'nbands': nbands, 'df': df})
         root.dump(measurements, f'bands/{event}.pickle')
 
+    Ledger('ft').mark(event)
+
 
 def _pad(data, nt):
     import numpy as np
@@ -329,23 +267,17 @@ def _pad(data, nt):
     
     return data[:nt]
 
-def _ft_trace(obs_tr, syn_tr, syn2_tr, wins_all, sta, cmp):
+def _ft_trace(obs_tr, syn_tr, wins_all, sta, cmp):
     from scipy.fft import fft
-    from pytomo3d.signal.process import sac_filter_trace
+    from .bands import band_plan, band_trace, bands
+    from .energy import Energy
     import numpy as np
-    import matplotlib
-    import matplotlib.pyplot as plt
 
-    matplotlib.use('Agg')
     np.seterr(all='raise')
 
     from sebox.catalog import catalog
 
     nbands = catalog.process['nbands']
-    bnames = ['#17-23s', '#23-40s', '#40-100s']
-    dtx = obs_tr.stats.delta / 60
-    ntx = obs_tr.stats.npts
-    t = np.linspace(0, (ntx-1) * dtx, ntx)
     
     nt_se = int(round((catalog.process['duration_encoding']) * 60 / catalog.process['dt']))
     df = 1 / catalog.process['dt'] / nt_se
@@ -355,16 +287,14 @@ def _ft_trace(obs_tr, syn_tr, syn2_tr, wins_all, sta, cmp):
     fincr = (imax - imin) // nbands
     imax = imin + fincr * nbands
 
-    cl = catalog.process['corner_left']
-    cr = catalog.process['corner_right']
+    plan = band_plan()
 
-    # print(nt_se, imin, imax, fincr)
+    # all bands of a trace are filtered at once when the first band with windows is measured
+    filtered = None
 
-    fobs = tp.cast(np.ndarray, fft(_pad(obs_tr.data, nt_se)))
-    fsyn = tp.cast(np.ndarray, fft(_pad(syn_tr.data, nt_se)))
-    fsyn2 = tp.cast(np.ndarray, fft(_pad(syn2_tr.data, nt_se)))
-    # fobs = tp.cast(np.ndarray, fft(obs_tr.data))
-    # fsyn = tp.cast(np.ndarray, fft(syn_tr.data))
+    # transform in double precision for float32 traces
+    fobs = tp.cast(np.ndarray, fft(_pad(np.asarray(obs_tr.data, dtype=float), nt_se)))
+    fsyn = tp.cast(np.ndarray, fft(_pad(np.asarray(syn_tr.data, dtype=float), nt_se)))
 
     output = {
         'syn': np.full(imax - imin, np.nan, dtype=complex),
@@ -384,198 +314,36 @@ def _ft_trace(obs_tr, syn_tr, syn2_tr, wins_all, sta, cmp):
         i1 = imin + iband * fincr
         i2 = i1 + fincr
 
-        obs = obs_tr.copy()
-        syn = syn_tr.copy()
-        
-        if sum(win.right - win.left + 1 for win in wins) / len(syn.data) < catalog.window['threshold_duration']:
+        if np.sum(wins.right - wins.left + 1) / len(syn_tr.data) < catalog.window['threshold_duration']:
             continue
-
-        fmin = i1 * df
-        fmax = (i2 - 1) * df
-        pre_filt = [fmin * cr, fmin, fmax, fmax / cl]
         
         try:
-            # obs.filter('bandpass', freqmin=fmin, freqmax=fmax)
-            # syn.filter('bandpass', freqmin=fmin, freqmax=fmax)
-            # print(obs.stats.npts, obs.stats.delta, syn.stats.npts, syn.stats.delta)
-            sac_filter_trace(obs, pre_filt)
-            sac_filter_trace(syn, pre_filt)
+            if filtered is None:
+                filtered = bands(obs_tr, plan), bands(syn_tr, plan)
+
+            obs = band_trace(obs_tr, filtered[0][iband])
+            syn = band_trace(syn_tr, filtered[1][iband])
         
         except:
-            # print('?', syn.data, obs.data)
             return
 
-        diff = syn.data - obs.data
-        syn_sum = sum(syn.data ** 2)
-        obs_sum = sum(obs.data ** 2)
-        diff_sum = sum(diff ** 2)
-
-        def emean(data):
-            return sum(data ** 2) / len(data)
-
-        ratio_syn = sum(sum(syn.data[win.left: win.right] ** 2 / syn_sum) for win in wins)
-        ratio_obs = sum(sum(obs.data[win.left: win.right] ** 2 / obs_sum) for win in wins)
-        ratio_diff = sum(sum(diff[win.left: win.right] ** 2 / diff_sum) for win in wins)
+        energy = Energy(obs.data, syn.data)
+        ratio_obs, ratio_syn, ratio_diff = (r[0] for r in energy.ratios(wins.left, wins.right))
 
         has_full = ratio_diff > catalog.window['threshold_diff']
         has_blended = ratio_syn > catalog.window['threshold_syn'] and ratio_obs > catalog.window['threshold_obs']
 
-        # if has_full or has_blended:
-        if has_full:
-            output['syn'][i1-imin: i2-imin] = fsyn[i1: i2]
-            output['obs'][i1-imin: i2-imin] = fobs[i1: i2]
-            output['win'][i1-imin: i2-imin] = fobs[i1: i2]
-            output['syn_bands'][iband] = 1
-
-            # plt.figure(figsize=(12, 8))
-            plt.figure(figsize=(20, 15))
-            plt.plot(t, obs.data, label='obs')
-            plt.plot(t, syn.data, label='syn')
-            plt.plot(t, syn2_tr.data, label='syn_new')
-            
-            for win in wins:
-                plt.axvspan(win.left * dtx, win.right * dtx, facecolor='lightgray')
-            
-            plt.legend()
-            plt.savefig(f'plots2/{sta}.{cmp}{bnames[iband]}.pdf')
-        
-        else:
+        if not has_full:
             continue
-        
-        if has_full:
-            output['obs_bands'][iband] = 1
+
+        output['syn'][i1-imin: i2-imin] = fsyn[i1: i2]
+        output['obs'][i1-imin: i2-imin] = fobs[i1: i2]
+        output['win'][i1-imin: i2-imin] = fobs[i1: i2]
+        output['syn_bands'][iband] = 1
+        output['obs_bands'][iband] = 1
 
         if has_blended:
             output['win_bands'][iband] = 1
-        
-        nt = int(catalog.process['period_max'] / catalog.process['dt'] / 2)
-        taper = np.hanning(nt * 2)
-
-        d1 = obs.data.copy()
-        d1_2 = obs.data.copy()
-        d1_3 = obs.data.copy()
-        d2 = syn.data
-        d3 = syn2_tr.data
-
-        bwins = []
-        bwins2 = []
-        title = ' '
-
-        syn_mean = 0.0
-        for win in wins:
-            syn_mean += sum(syn.data[win.left:win.right+1] ** 2)
-        syn_mean /= len(syn.data)
-
-        for i, win in enumerate(wins):
-            fl = 0 if i == 0 else wins[i-1].right + nt + 1
-            fr = len(d1) - 1 if i == len(wins) - 1 else wins[i+1].left - nt - 1
-
-            if win.left - fl >= nt:
-                l = win.left - nt
-                r = win.left
-                d1[fl: l] = d2[fl: l]
-                d1[l: r] += (d2[l: r] - d1[l: r]) * taper[nt:]
-                bwins.append((fl,r))
-                
-                rb = emean(d2[fl:r]) / syn_mean
-                title += f'{rb:.2f} '
-
-                if rb < catalog.window['threshold_blend']:
-                    d1_2[fl:r] = d1[fl:r]
-                    d1_3[fl: l] = d3[fl: l]
-                    d1_3[l: r] += (d3[l: r] - d1_3[l: r]) * taper[nt:]
-                    bwins2.append((fl,r))
-
-            
-            if fr - win.right >= nt:
-                l = win.right + 1
-                r = win.right + nt + 1
-                d1[r: fr + 1] = d2[r: fr + 1]
-                d1[l: r] += (d2[l: r] - d1[l: r]) * taper[:nt]
-                bwins.append((l,fr+1))
-
-                rb = emean(d2[l:fr+1]) / syn_mean
-                title += f'{rb:.2f} '
-
-                if rb < catalog.window['threshold_blend']:
-                    d1_2[l:fr+1] = d1[l:fr+1]
-                    d1_3[r: fr + 1] = d3[r: fr + 1]
-                    d1_3[l: r] += (d3[l: r] - d1_3[l: r]) * taper[:nt]
-                    bwins2.append((l,fr+1))
-        
-        # if len(bwins):
-        #     # plt.figure(figsize=(12, 8))
-        #     plt.figure(figsize=(20, 15))
-        #     plt.plot(t, d1, label='obs')
-        #     plt.plot(t, d2, label='syn')
-
-        #     for win in bwins:
-        #         plt.axvspan(win[0] * dtx, win[1] * dtx, facecolor='lightgray')
-            
-        #     plt.legend()
-        #     plt.title(title)
-        #     plt.savefig(f'plots/{sta}.{cmp}{bnames[iband]}_w1.pdf')
-        
-        if len(bwins2):
-            plt.figure(figsize=(20, 15))
-            plt.plot(t, obs.data, label='obs')
-            plt.plot(t, d1_2, label='obs_win')
-            plt.plot(t, syn.data, label='syn')
-            plt.plot(t, syn2_tr.data, label='syn_new')
-            
-            for win in wins:
-                plt.axvspan(win.left * dtx, win.right * dtx, facecolor='lightgray')
-            
-            plt.legend()
-            plt.savefig(f'plots/{sta}.{cmp}{bnames[iband]}.pdf')
-
-            # # plt.figure(figsize=(12, 8))
-            # plt.figure(figsize=(20, 15))
-            # plt.plot(t, d1_2, label='obs')
-            # plt.plot(t, d2, label='syn')
-            # plt.plot(t, syn2_tr.data, label='syn_new')
-            
-            # for win in bwins2:
-            #     plt.axvspan(win[0] * dtx, win[1] * dtx, facecolor='palegreen')
-            
-            # plt.legend()
-            # plt.savefig(f'plots/{sta}.{cmp}{bnames[iband]}_w.pdf')
-        
-        plt.figure(figsize=(20, 15))
-        plt.plot(t, obs.data, label='obs')
-        plt.plot(t, d1_2, label='win')
-        plt.plot(t, d1_3, label='win(49)')
-        
-        for win in wins:
-            plt.axvspan(win.left * dtx, win.right * dtx, facecolor='lightgray')
-        
-        plt.legend()
-        plt.savefig(f'plots2/{sta}.{cmp}{bnames[iband]}.win.pdf')
-        
-        # output['win'][i1-imin: i2-imin] = fft(_pad(d1, nt_se))[i1: i2]
-        plt.figure(figsize=(12, 8))
-        plt.plot(np.angle(fobs[i1: i2] / fsyn[i1: i2]), label='original')
-        # if len(bwins):
-        #     plt.plot(np.angle(fft(_pad(d1, nt_se))[i1: i2] / fsyn[i1: i2]), label='w1')
-        #     pname += '1'
-        if len(bwins2):
-            plt.plot(np.angle(fft(_pad(d1_2, nt_se))[i1: i2] / fsyn[i1: i2]), label='windowed')
-            plt.plot(np.angle(fft(_pad(d1_3, nt_se))[i1: i2] / fsyn[i1: i2]), label='windowed(49)')
-            plt.legend()
-            plt.savefig(f'plots/{sta}.{cmp}{bnames[iband]}.pdf')
-        else:
-            plt.legend()
-            plt.savefig(f'plots3/{sta}.{cmp}{bnames[iband]}.pdf')
-
-        
-        if len(bwins2):
-            plt.figure(figsize=(12, 8))
-            plt.plot(np.angle(fft(_pad(d1_2, nt_se))[i1: i2] / fsyn[i1: i2]), label='old')
-            plt.plot(np.angle(fft(_pad(d1_2, nt_se))[i1: i2] / fsyn2[i1: i2]), label='new')
-            plt.plot(np.angle(fft(_pad(d1_3, nt_se))[i1: i2] / fsyn2[i1: i2]), label='new(49)')
-            plt.legend()
-            plt.savefig(f'plots/{sta}.{cmp}{bnames[iband]}.iter.pdf')
-
 
     if any(output['syn_bands']):
         return output
@@ -583,16 +351,56 @@ def _ft_trace(obs_tr, syn_tr, syn2_tr, wins_all, sta, cmp):
 
 def window_event(node):
     from seisbp import SeisBP
+    from .windows import done
+    from .balance import schedule
 
     src = f'{node.event}.bp'
-    # node.mkdir(f'blend/{node.event}')
+    dst = f'blend_obs/{node.event}'
+
+    # skip stations stored by a previous run
+    finished = done(f'{dst}/windows')
 
     with SeisBP(f'proc_syn/{src}', 'r') as bp:
-        stations = bp.stations
+        stations = [sta for sta in bp.stations if sta not in finished]
+        evt = bp.read(bp.events[0])
     
-    node.add_mpi(_blend, node.np, name=f'blend_{node.event}',
-        args=(f'proc_obs/{src}', f'proc_syn/{src}', f'blend_obs/{node.event}'),
-        mpiarg=stations, group_mpiarg=True, cwd=f'log_blend')
+    if len(stations):
+        # stations of each rank balanced by estimated cost
+        groups = schedule(stations, evt, _timings(dst), node.np)
+
+        node.add_mpi(_blend, len(groups), name=f'blend_{node.event}',
+            args=(f'proc_obs/{src}', f'proc_syn/{src}', dst),
+            mpiarg=groups, cwd=f'log_blend')
+
+    node.add(merge_windows, args=(dst,))
+
+
+def _timings(dst):
+    """Time of window selection of each station in previous and interrupted runs."""
+    from os.path import basename
+    from nnodes import root
+    from .balance import collect
+
+    src = f'timings/{basename(dst)}.pickle'
+
+    return collect(f'{dst}/windows/timings', root.load(src) if root.has(src) else None)
+
+
+def merge_windows(dst):
+    """Merge window records and rejected bands of all ranks into {dst}.npz."""
+    from os.path import basename
+    from nnodes import root
+    from .windows import merge
+    from .screen import collect
+    from .ledger import Ledger
+
+    merge(f'{dst}/windows', f'{dst}.npz', collect(f'{dst}/windows/screened'))
+    Ledger('window').mark(basename(dst))
+
+    # timings are kept for load balancing of later runs
+    root.mkdir('timings')
+    root.dump(_timings(dst), f'timings/{basename(dst)}.pickle')
+    root.rm(f'{dst}/windows')
 
 
 def _blend3(np, stas, obs, syn, dst):
@@ -611,136 +419,270 @@ def _blendx(obs, syn, dst, stas):
 def _blend(stas, obs, syn, dst) -> tp.Any:
     from seisbp import SeisBP
     from nnodes import root
-    import logging
-    import warnings
+    from .windows import WindowWriter, WindowCache, dtype
+    from .screen import write
+    from . import balance
+    from time import perf_counter
+    import numpy as np
 
-    logging.disable()
-    warnings.filterwarnings("ignore")
+    _quiet()
 
     ###### FIXME
     traces = root.load('traces.pickle')
-    root.mkdir(f'{dst}/plots')
     ######
 
-    with SeisBP(obs, 'r', True) as obs_bp, SeisBP(syn, 'r', True) as syn_bp:
+    with SeisBP(obs, 'r', True) as obs_bp, SeisBP(syn, 'r', True) as syn_bp, _pool() as pool:
         # SeisBP(dst, 'w', True) as dst_bp:
         evt = syn_bp.read(syn_bp.events[0])
 
         # if root.mpi.rank == 0:
         #     dst_bp.write(evt)
 
-        for sta in stas:
-            if root.has(f'{dst}/{sta}.pickle'):
-                continue
+        # each rank appends to its own files so no locking is needed
+        writer = WindowWriter(f'{dst}/windows', root.mpi.rank)
+        cache = WindowCache(f'cache/windows/{syn_bp.events[0]}', root.mpi.rank)
 
-            output = {}
+        for sta in stas:
+            output = []
+            screened = []
+            jobs = []
+            start = perf_counter()
 
             inv = syn_bp.read(sta)
 
-            ###### FIXME
-            for cmp in ('Z',):
-            # for cmp in ('R', 'T', 'Z'):
+            # traces are read and cache is accessed in this thread, selection runs in the pool
+            for cmp in ('R', 'T', 'Z'):
                 try:
                     obs_tr = obs_bp.trace(sta, cmp)
                     syn_tr = syn_bp.trace(sta, cmp)
+                    bands = traces[sta][cmp]
                 
                 except:
-                    output[cmp] = [[], [], []]
+                    continue
 
-                else:
-                    output[cmp] = _window(obs_tr, syn_tr, evt, inv, cmp, traces[sta][cmp], f'{dst}/plots/{sta}')
+                records, pending, selector = _window_prepare(obs_tr, syn_tr, evt, inv, cmp, bands, cache)
+                output.append(records)
+
+                # one job per component so that traces, event and inventory are sent to the pool once for all bands
+                if len(pending):
+                    jobs.append((records, pool.submit(_window_select, evt, inv, cmp, pending, selector)))
+
+            for records, job in jobs:
+                _window_store(records, *job.result(), cache, screened)
             
-            root.dump(output, f'{dst}/{sta}.pickle')
-            print(f'{dst}/{sta}.pickle')
+            # rejected bands are logged before the station is marked as done
+            write(f'{dst}/windows/screened', root.mpi.rank, screened)
+            writer.append(sta, np.concatenate([np.zeros(0, dtype=dtype)] +
+                [wins for records in output for wins in records]))
+            balance.write(f'{dst}/windows/timings', root.mpi.rank, sta, perf_counter() - start)
+
+            print(dst, sta)
     
     print(root.mpi.rank, 'done')
 
 
-def _window(obs_tr, syn_tr, evt, inv, cmp, bands, dst):
-    from pyflex import Config, WindowSelector
-    from pytomo3d.signal.process import sac_filter_trace
+def _quiet():
+    """Silence pyflex and obspy in window selection."""
+    import logging
+    import warnings
+
+    logging.disable()
+    warnings.filterwarnings("ignore")
+
+
+def _pool():
+    """Thread or process pool selecting windows within a rank ([window] workers and pool)."""
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    from multiprocessing import get_context
+    from sebox.catalog import catalog
+
+    workers = catalog.window.get('workers', 1)
+
+    if catalog.window.get('pool') == 'process' and workers > 1:
+        # forking an MPI rank duplicates its MPI state, workers are started as fresh interpreters instead
+        return ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'), initializer=_quiet)
+
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def _window(obs_tr, syn_tr, evt, inv, cmp, bands=None, cache=None, selector=None, screened=None, filtered=None):
+    """Window records of each band, reused from cache if inputs are unchanged.
+
+    Bands that cannot pass the global data quality check are skipped and appended to screened."""
+    import numpy as np
+
+    output, pending, selector = _window_prepare(obs_tr, syn_tr, evt, inv, cmp, bands, cache, selector, filtered)
+
+    if len(pending):
+        _window_store(output, *_window_select(evt, inv, cmp, pending, selector), cache, screened)
+    
+    return [records.view(np.recarray) for records in output]
+
+
+def _window_prepare(obs_tr, syn_tr, evt, inv, cmp, bands=None, cache=None, selector=None, filtered=None):
+    """Cached window records of each band and bands to be selected as (band, obs, syn, params, key).
+
+    filtered: bands of obs_tr and syn_tr from sebox.catalog.bands.bands (filtered here if not given)"""
+    from .bands import band_plan, band_trace, bands as filter_trace
+    from .windows import dtype, window_key
     import numpy as np
 
     from sebox.catalog import catalog
 
     nbands = catalog.process['nbands']
+    plan = band_plan()
 
-    df = 1 / catalog.process['duration_encoding'] / 60
-    imin = int(np.ceil(1 / catalog.process['period_max'] / df))
-    imax = int(np.floor(1 / catalog.process['period_min'] / df)) + 1
-    fincr = (imax - imin) // nbands
-    imax = imin + fincr * nbands
-
-    cl = catalog.process['corner_left']
-    cr = catalog.process['corner_right']
+    # "pyflex" or "native" (sebox.catalog.flexwin)
+    selector = selector or catalog.window.get('selector', 'pyflex')
 
-    output = [[]] * nbands
+    output = [np.zeros(0, dtype=dtype)] * nbands
+    pending = []
 
     for iband in range(nbands):
-        ###### FIXME: remove parameter `bands` and `dst`
-        savefig = catalog.window.get('savefig')
-        bnames = ['#17-23s', '#23-40s', '#40-100s']
-        if bands[iband] == 0:
-            output[iband] = []
+        # skip bands without measurements
+        if bands is not None and bands[iband] == 0:
             continue
-        ######
 
-        i1 = imin + iband * fincr
-        i2 = i1 + fincr
-
-        obs = obs_tr.copy()
-        syn = syn_tr.copy()
+        # all bands of a trace are filtered with one transform
+        if filtered is None:
+            filtered = filter_trace(obs_tr, plan), filter_trace(syn_tr, plan)
 
-        fmin = i1 * df
-        fmax = (i2 - 1) * df
-        pre_filt = [fmin * cr, fmin, fmax, fmax / cl]
-        
-        sac_filter_trace(obs, pre_filt)
-        sac_filter_trace(syn, pre_filt)
+        fmin = plan[iband][1]
+        fmax = plan[iband][2]
+        obs = band_trace(obs_tr, filtered[0][iband])
+        syn = band_trace(syn_tr, filtered[1][iband])
     
         cfg = catalog.window['flexwin']
-        config = Config(min_period=1/fmax, max_period=1/fmin, **{**cfg['default'], **cfg[cmp]})
-        ws = WindowSelector(obs, syn, config, evt, inv)
+        params = {'min_period': 1/fmax, 'max_period': 1/fmin, **cfg['default'], **cfg[cmp]}
+        key = None
 
-        try:
-            output[iband] = ws.select_windows()
+        if cache is not None:
+            key = window_key(obs, syn, iband, params if selector == 'pyflex' else {**params, 'selector': selector}, evt, inv)
 
-            if savefig and len(output[iband]):
-                # use non-interactive backend
-                import matplotlib
-                matplotlib.use('Agg')
+            if (records := cache.get(key)) is not None:
+                output[iband] = records
+                continue
+
+        pending.append((iband, obs, syn, params, key))
+
+    return output, pending, selector
+
+
+def _window_select(evt, inv, cmp, pending, selector):
+    """Select windows of bands returned by _window_prepare (runs in a worker of _pool).
+
+    Returns (band, records, key) of selected bands (key is None if not to be cached) and rejected bands."""
+    from pyflex import Config
+    from .ttimes import table_selector
+    from .windows import from_pyflex
+
+    obs = pending[0][1]
+    sta = f'{obs.stats.network}.{obs.stats.station}'
+    geo = _geometry(obs, evt, inv, pending[0][3])
+    screened = []
 
-                ws.plot(filename=dst + bnames[iband] + '.png')
+    if geo is not None and geo[0] is not None:
+        pending = _screen(sta, cmp, pending, geo[0], screened)
+
+    if selector == 'native':
+        if geo is None or len(pending) == 0:
+            return [], screened
+
+        return _window_native(sta, cmp, pending, geo), screened
+
+    selected = []
+
+    for iband, obs, syn, params, key in pending:
+        ws = table_selector(obs, syn, Config(**params), evt, inv)
+
+        try:
+            selected.append((iband, from_pyflex(sta, cmp, iband, ws.select_windows()), key))
         
         except Exception:
-            pass
-    
-    return output
+            # band is stored without windows and not cached, selected again only if the event is cleared with ledger.reset
+            continue
+
+    return selected, screened
+
+
+def _window_store(output, selected, rejected, cache, screened):
+    """Put selected windows to output and cache and rejected bands to screened."""
+    for iband, records, key in selected:
+        output[iband] = records
+
+        if cache is not None and key is not None:
+            cache.put(key, records)
+
+    # rejections are not cached so that they are logged again in another run
+    if screened is not None:
+        screened.extend(rejected)
+
+
+def _geometry(obs_tr, evt, inv, params):
+    """First arrival, origin time minus start time and distance of a trace (None if station is not in inventory)."""
+    from .flexwin import geometry
+
+    try:
+        return geometry(obs_tr, evt, inv, params.get('earth_model', 'ak135'))
+
+    except Exception:
+        return None
+
+
+def _screen(sta, cmp, pending, first, screened):
+    """Remove bands that cannot pass the global data quality check of pyflex."""
+    import numpy as np
+    from .screen import screen
+
+    passed, snr_int, snr_amp = screen(np.stack([p[1].data for p in pending]), [p[3] for p in pending], first)
+
+    for i in np.nonzero(~passed)[0]:
+        screened.append((sta, cmp, pending[i][0], snr_int[i], snr_amp[i]))
+
+    return [p for p, ok in zip(pending, passed) if ok]
+
+
+def _window_native(sta, cmp, pending, geo):
+    """Select windows of multiple bands of a trace with sebox.catalog.flexwin."""
+    from .flexwin import select_windows
+    from .windows import from_flexwin
+
+    first, offset, dist = geo
+    dt = pending[0][1].stats.delta
+    n = len(pending)
+    wins = select_windows([p[1].data for p in pending], [p[2].data for p in pending], dt,
+        [p[3] for p in pending], [first] * n, [offset] * n, [dist] * n)
+
+    # selection without arrival times is stored but not cached, so it is not reused after the event is cleared with ledger.reset
+    return [(iband, from_flexwin(sta, cmp, iband, w, dt), key if first is not None else None)
+        for (iband, _, _, _, key), w in zip(pending, wins)]
 
 
 def _blend_trace(obs_tr, syn_tr, evt, inv, cmp, event, station):
-    from pyflex import Config, WindowSelector
-    from nnodes import root
+    from pyflex import Config
+    from .ttimes import table_selector
     from scipy.fft import fft
-    from pytomo3d.signal.process import sac_filter_trace
+    from .bands import band_plan, band_trace, bands
+    from .blend import blend, blend_masks, gaps
+    from .energy import Energy
     import numpy as np
 
     from sebox.catalog import catalog
 
-    savefig = catalog.window.get('savefig')
     nbands = catalog.process['nbands']
+    nt = int(catalog.process['period_max'] / catalog.process['dt'] / 2)
 
     df = 1 / catalog.process['duration_encoding'] / 60
     imin = int(np.ceil(1 / catalog.process['period_max'] / df))
     imax = int(np.floor(1 / catalog.process['period_min'] / df)) + 1
     fincr = (imax - imin) // nbands
     imax = imin + fincr * nbands
+    plan = band_plan()
 
-    cl = catalog.process['corner_left']
-    cr = catalog.process['corner_right']
-
-    fobs = tp.cast(np.ndarray, fft(obs_tr.data))
-    fsyn = tp.cast(np.ndarray, fft(syn_tr.data))
+    fobs = tp.cast(np.ndarray, fft(np.asarray(obs_tr.data, dtype=float)))
+    fsyn = tp.cast(np.ndarray, fft(np.asarray(syn_tr.data, dtype=float)))
+    obs_bands = bands(obs_tr, plan)
+    syn_bands = bands(syn_tr, plan)
 
     output = {
         'syn': np.full(imax - imin, np.nan, dtype=complex),
@@ -751,24 +693,22 @@ def _blend_trace(obs_tr, syn_tr, evt, inv, cmp, event, station):
         'blend_bands': np.zeros(nbands, dtype=int)
     }
 
+    # bands to blend, gaps of all bands are blended at once after window selection
+    blended = []
+    starts, ends, risings, rows = [], [], [], []
+
     for iband in range(nbands):
         i1 = imin + iband * fincr
         i2 = i1 + fincr
 
-        obs = obs_tr.copy()
-        syn = syn_tr.copy()
-
-        fmin = i1 * df
-        fmax = (i2 - 1) * df
-        tag = f'{obs.stats.channel}_{int(1/fmax)}-{int(1/fmin)}'
-        pre_filt = [fmin * cr, fmin, fmax, fmax / cl]
-        
-        sac_filter_trace(obs, pre_filt)
-        sac_filter_trace(syn, pre_filt)
+        fmin = plan[iband][1]
+        fmax = plan[iband][2]
+        obs = band_trace(obs_tr, obs_bands[iband])
+        syn = band_trace(syn_tr, syn_bands[iband])
     
         cfg = catalog.window['flexwin']
         config = Config(min_period=1/fmax, max_period=1/fmin, **{**cfg['default'], **cfg[cmp]})
-        ws = WindowSelector(obs, syn, config, evt, inv)
+        ws = table_selector(obs, syn, config, evt, inv)
 
         try:
             wins = ws.select_windows()
@@ -776,87 +716,42 @@ def _blend_trace(obs_tr, syn_tr, evt, inv, cmp, event, station):
         except Exception:
             continue
 
-        diff = syn.data - obs.data
-        ratio_syn = sum(sum(syn.data[win.left: win.right] ** 2) for win in wins) / sum(syn.data ** 2)
-        ratio_obs = sum(sum(obs.data[win.left: win.right] ** 2) for win in wins) / sum(obs.data ** 2)
-        ratio_diff = sum(sum(diff[win.left: win.right] ** 2) for win in wins) / sum(diff ** 2)
+        ratio_obs, ratio_syn, ratio_diff = (r[0] for r in Energy(obs.data, syn.data).ratios(
+            [win.left for win in wins], [win.right for win in wins]))
 
         has_full = ratio_diff > catalog.window['threshold_diff']
         has_blended = ratio_syn > catalog.window['threshold_syn'] and ratio_obs > catalog.window['threshold_obs']
-        d = root.subdir(f'blend/{event}/{station}')
 
         if has_full or has_blended:
             output['syn'][i1-imin: i2-imin] = fsyn[i1: i2]
             output['syn_bands'][iband] = 1
-
-            if savefig:
-                # use non-interactive backend
-                import matplotlib
-                matplotlib.use('Agg')
-
-                d.mkdir()
-                ws.plot(filename=d.path(f'{tag}.png'))
         
         if has_full:
             output['obs'][i1-imin: i2-imin] = fobs[i1: i2]
             output['obs_bands'][iband] = 1
 
         if has_blended:
-            nt = int(catalog.process['period_max'] / catalog.process['dt'] / 2)
-            taper = np.hanning(nt * 2)
-
-            d1 = obs.data
-            d2 = syn.data
-
-            for i, win in enumerate(wins):
-                fl = 0 if i == 0 else wins[i-1].right + nt + 1
-                fr = len(d1) - 1 if i == len(wins) - 1 else wins[i+1].left - nt - 1
-
-                if win.left - fl >= nt:
-                    l = win.left - nt
-                    r = win.left
-                    d1[fl: l] = d2[fl: l]
-                    d1[l: r] += (d2[l: r] - d1[l: r]) * taper[nt:]
-                
-                if fr - win.right >= nt:
-                    l = win.right + 1
-                    r = win.right + nt + 1
-                    d1[r: fr + 1] = d2[r: fr + 1]
-                    d1[l: r] += (d2[l: r] - d1[l: r]) * taper[:nt]
-            
-            output['blend'][i1-imin: i2-imin] = fft(d1)[i1: i2]
+            start, end, rising = gaps([win.left for win in wins], [win.right for win in wins], len(syn.data), nt)
+            starts.append(start)
+            ends.append(end)
+            risings.append(rising)
+            rows.append(np.full(len(start), len(blended)))
+            blended.append((iband, obs.data, syn.data))
+
+    if len(blended):
+        # masks of all blended bands in one pass, then one batched transform
+        npts = len(blended[0][2])
+        masks = blend_masks(np.concatenate(starts), np.concatenate(ends), np.concatenate(risings),
+            np.concatenate(rows), len(blended), npts, nt)
+        d1 = blend(np.stack([b[1] for b in blended]), np.stack([b[2] for b in blended]), masks)
+        fblend = fft(np.asarray(d1, dtype=float), axis=-1)
+
+        for k, (iband, _, _) in enumerate(blended):
+            i1 = imin + iband * fincr
+            i2 = i1 + fincr
+            output['blend'][i1-imin: i2-imin] = fblend[k, i1: i2]
             output['blend_bands'][iband] = 1
 
-            if savefig:
-                import matplotlib.pyplot as plt
-
-                f1 = fobs[i1: i2]
-                f2 = fsyn[i1: i2]
-                f3 = output['blend'][i1-imin: i2-imin]
-                
-                plt.clf()
-                plt.figure()
-                plt.title(f'{station}.{tag} {ratio_obs:.2f} {ratio_syn:.2f}')
-                
-                plt.subplot(3, 1, 1)
-                plt.plot(d1, label='obs_blend')
-                plt.plot(d2, label='syn')
-                plt.legend()
-
-                plt.subplot(3, 1, 2)
-                plt.plot(np.angle(f1), label='obs')
-                plt.plot(np.angle(f2), label='syn')
-                plt.plot(np.angle(f1 / f2), label='diff')
-                plt.legend()
-
-                plt.subplot(3, 1, 3)
-                plt.plot(np.angle(f3), label='obs_blend')
-                plt.plot(np.angle(f2), label='syn')
-                plt.plot(np.angle(f3 / f2), label='diff')
-                plt.legend()
-                
-                plt.savefig(d.path(f'{tag}_blend.png'))
-
     if any(output['syn_bands']):
         return output
 
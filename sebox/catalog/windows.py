@@ -0,0 +1,275 @@
+import typing as tp
+
+import numpy as np
+
+
+# fields of a window record
+dtype = np.dtype([
+    # station name (network.station)
+    ('station', 'U16'),
+
+    # component (R, T or Z)
+    ('component', 'U1'),
+
+    # index of frequency band
+    ('band', 'i2'),
+
+    # first and last sample of the window
+    ('left', 'i4'),
+    ('right', 'i4'),
+
+    # maximum cross correlation coefficient
+    ('cc', 'f4'),
+
+    # amplitude anomaly
+    ('dlnA', 'f4'),
+
+    # time shift in seconds
+    ('tshift', 'f4')
+])
+
+
+def from_pyflex(station: str, cmp: str, band: int, wins: tp.List[tp.Any]) -> np.ndarray:
+    """Convert windows selected by pyflex to records."""
+    records = np.zeros(len(wins), dtype=dtype)
+
+    for i, win in enumerate(wins):
+        records[i] = (station, cmp, band, win.left, win.right,
+            win.max_cc_value, win.dlnA, win.cc_shift * win.dt)
+
+    return records
+
+
+def from_flexwin(station: str, cmp: str, band: int, wins: np.ndarray, dt: float) -> np.ndarray:
+    """Convert windows selected by sebox.catalog.flexwin to records."""
+    records = np.zeros(len(wins), dtype=dtype)
+    records['station'] = station
+    records['component'] = cmp
+    records['band'] = band
+    records['left'] = wins['left']
+    records['right'] = wins['right']
+    records['cc'] = wins['max_cc_value']
+    records['dlnA'] = wins['dlnA']
+    records['tshift'] = wins['cc_shift'] * dt
+
+    return records
+
+
+class WindowTable:
+    """Windows of an event with lookup by station."""
+    # window records sorted by station
+    records: np.ndarray
+
+    # first and last record of each station
+    offsets: tp.Dict[str, tp.Tuple[int, int]]
+
+    # bands rejected before window selection (dtype of sebox.catalog.screen)
+    screened: tp.Optional[np.ndarray]
+
+    def __init__(self, records: np.ndarray, stations: np.ndarray, offsets: np.ndarray,
+        screened: tp.Optional[np.ndarray] = None):
+        self.records = records
+        self.offsets = {sta: (offsets[i], offsets[i + 1]) for i, sta in enumerate(stations)}
+        self.screened = screened
+
+    @property
+    def stations(self) -> tp.List[str]:
+        """Stations with windows or processed without windows."""
+        return list(self.offsets)
+
+    def get(self, station: str, cmp: tp.Optional[str] = None, band: tp.Optional[int] = None) -> np.recarray:
+        """Windows of a station, optionally of a component and band (fields are accessible as attributes)."""
+        start, end = self.offsets.get(station, (0, 0))
+        records = self.records[start: end]
+
+        if cmp is not None:
+            records = records[records['component'] == cmp]
+
+        if band is not None:
+            records = records[records['band'] == band]
+
+        return records.view(np.recarray)
+
+    def __contains__(self, station: str):
+        return station in self.offsets
+
+
+def save(records: np.ndarray, stations: tp.Iterable[str], dst: str, screened: tp.Optional[np.ndarray] = None):
+    """Save window records of an event to one file, including stations without windows and rejected bands."""
+    from nnodes import root
+
+    stations = sorted(set(stations) | set(records['station']))
+    records = records[np.argsort(records['station'], kind='stable')]
+
+    # index of the first record of each station
+    offsets = np.append(np.searchsorted(records['station'], stations), len(records)).astype(np.int64)
+
+    extra = {} if screened is None else {'screened': screened}
+
+    with open(root.path(dst), 'wb') as f:
+        np.savez(f, records=records, stations=np.array(stations, dtype=dtype['station']), offsets=offsets, **extra)
+
+
+def load(src: str) -> WindowTable:
+    """Load window records of an event."""
+    from nnodes import root
+
+    with np.load(root.path(src)) as f:
+        return WindowTable(f['records'], f['stations'], f['offsets'], f['screened'] if 'screened' in f.files else None)
+
+
+class WindowWriter:
+    """Append-only window records of one rank, resumable after a crash."""
+    # file of raw records
+    data: str
+
+    # file with one "key start end" line per station (or cache key) whose records are complete
+    index: str
+
+    # number of complete records in data file
+    size: int
+
+    def __init__(self, dst: str, rank: int):
+        from os import path, truncate
+        from nnodes import root
+
+        root.mkdir(dst)
+        self.data = root.path(f'{dst}/{rank:04d}.bin')
+        self.index = root.path(f'{dst}/{rank:04d}.txt')
+        self.size = max((end for _, _, end in _read_index(self.index)), default=0)
+
+        # discard records written after the last index entry
+        if path.exists(self.data) and path.getsize(self.data) > self.size * dtype.itemsize:
+            truncate(self.data, self.size * dtype.itemsize)
+
+    def append(self, key: str, records: np.ndarray):
+        """Append records of a station, index entry is written after data so that a station is either complete or absent."""
+        from os import fsync
+
+        with open(self.data, 'ab') as f:
+            f.write(records.astype(dtype).tobytes())
+            f.flush()
+            fsync(f.fileno())
+
+        start = self.size
+        self.size += len(records)
+
+        with open(self.index, 'a') as f:
+            f.write(f'{key} {start} {self.size}\n')
+
+
+def _read_index(src: str) -> tp.List[tp.Tuple[str, int, int]]:
+    from os import path
+
+    if not path.exists(src):
+        return []
+
+    entries = []
+
+    with open(src, 'r') as f:
+        for line in f.readlines():
+            # skip incomplete last line
+            if line.endswith('\n') and len(ll := line.split()) == 3:
+                entries.append((ll[0], int(ll[1]), int(ll[2])))
+
+    return entries
+
+
+def done(src: str) -> tp.Set[str]:
+    """Stations whose windows are stored in directory src by any rank."""
+    from nnodes import root
+
+    if not root.has(src):
+        return set()
+
+    stations = set()
+
+    for f in root.ls(src):
+        if f.endswith('.txt'):
+            stations.update(sta for sta, _, _ in _read_index(root.path(f'{src}/{f}')))
+
+    return stations
+
+
+def merge(src: str, dst: str, screened: tp.Optional[np.ndarray] = None):
+    """Collect window records written by all ranks in directory src into file dst."""
+    from nnodes import root
+
+    records = [np.zeros(0, dtype=dtype)]
+    stations = []
+
+    for f in sorted(root.ls(src)):
+        if f.endswith('.txt'):
+            entries = _read_index(root.path(f'{src}/{f}'))
+            data = np.fromfile(root.path(f'{src}/{f[:-4]}.bin'), dtype=dtype) if entries else None
+
+            for sta, start, end in entries:
+                records.append(data[start: end])
+                stations.append(sta)
+
+    save(np.concatenate(records), stations, dst, screened)
+
+
+class WindowCache:
+    """Persistent window records of single traces and bands keyed by a hash of all inputs of window selection."""
+    # directory of cache files
+    src: str
+
+    # data file and range of records of each key
+    entries: tp.Dict[str, tp.Tuple[str, int, int]]
+
+    # writer of this rank
+    writer: WindowWriter
+
+    def __init__(self, src: str, rank: int):
+        from nnodes import root
+
+        self.writer = WindowWriter(src, rank)
+        self.src = src
+        self.entries = {}
+
+        for f in root.ls(src):
+            if f.endswith('.txt'):
+                for key, start, end in _read_index(root.path(f'{src}/{f}')):
+                    self.entries[key] = (root.path(f'{src}/{f[:-4]}.bin'), start, end)
+
+    def get(self, key: str) -> tp.Optional[np.ndarray]:
+        if key not in self.entries:
+            return None
+
+        src, start, end = self.entries[key]
+
+        return np.fromfile(src, dtype=dtype, count=end - start, offset=start * dtype.itemsize)
+
+    def put(self, key: str, records: np.ndarray):
+        start = self.writer.size
+        self.writer.append(key, records)
+        self.entries[key] = (self.writer.data, start, self.writer.size)
+
+
+def window_key(obs: tp.Any, syn: tp.Any, band: int, params: dict, evt: tp.Any, inv: tp.Any) -> str:
+    """Hash of filtered traces, band, pyflex parameters, event origin, station metadata and travel time table."""
+    from hashlib import sha1
+    from json import dumps
+    import pyflex
+    from .ttimes import table_digest
+
+    h = sha1()
+
+    for tr in (obs, syn):
+        h.update(f'{tr.id} {tr.stats.starttime} {tr.stats.delta} {tr.data.dtype.str}'.encode())
+        h.update(np.ascontiguousarray(tr.data).view(np.uint8))
+
+    origin = evt.preferred_origin() or evt.origins[0]
+    h.update(f'{band} {origin.time} {origin.latitude} {origin.longitude} {origin.depth}'.encode())
+    h.update(dumps(params, sort_keys=True, default=str).encode())
+    h.update(getattr(pyflex, '__version__', '').encode())
+
+    # arrival times decide the range of selected windows
+    h.update(table_digest().encode())
+
+    for net in inv:
+        for sta in net:
+            h.update(f'{net.code}.{sta.code} {sta.latitude} {sta.longitude} {sta.elevation}'.encode())
+
+    return h.hexdigest()
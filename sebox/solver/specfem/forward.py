@@ -44,6 +44,8 @@ def setup(node: Node):
 
 def align(node: Node):
     """Convert output seismograms with processing format."""
+    from sebox.catalog.catalog import get_dtype
+
     lines = node.readlines('OUTPUT_FILES/seismogram_stats.txt')
     dt_adj = float(lines[0].split('=')[-1])
     nt_adj = int(lines[1].split('=')[-1])
@@ -73,16 +75,18 @@ def align(node: Node):
                     nodes[p].append(sta)
 
     node.mkdir('stations')
-    node.add_mpi(_align, arg=(stats, nodes), arg_mpi=catalog.stations)
+
+    # aligned traces have the same precision as processed traces, passed to the MPI task as a string
+    node.add_mpi(_align, arg=(stats, nodes, get_dtype().name), arg_mpi=catalog.stations)
 
 
-def _align(arg: tp.Tuple[dict, tp.Dict[int, tp.List[str]]], stas: tp.List[str]):
+def _align(arg: tp.Tuple[dict, tp.Dict[int, tp.List[str]], str], stas: tp.List[str]):
     import numpy as np
     from scipy.io import FortranFile
     from nnodes import root
     
-    stats, nodes = arg
-    data = np.full([len(stas), len(stats['cmps']), stats['nt']], np.nan)
+    stats, nodes, dtype = arg
+    data = np.full([len(stas), len(stats['cmps']), stats['nt']], np.nan, dtype=dtype)
 
     for p, pstas in nodes.items():
         if any(sta in stas for sta in pstas):